@@ -25,4 +25,6 @@ sys.path.insert(0, here)
 
 from kibom.__main__ import main  # noqa: E402
 
-main()
+# Guarded, as batch mode (--batch) imports this module in worker processes
+if __name__ == '__main__':
+    main()
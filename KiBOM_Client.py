@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+    @package
+    KiBOM - Bill of Materials generation for KiCad
+
+    Thin client for the KiBOM server. Takes the same arguments as KiBOM_CLI.py,
+    and sends them to a running server (python KiBOM_CLI.py --server ~/.kibom.sock),
+    which keeps KiBOM loaded between runs. If no server is running, the BoM is
+    generated as by KiBOM_CLI.py.
+
+    e.g. as the KiCad BOM plugin command:
+    python KiBOM_Client.py "%I" "%O.html"
+"""
+
+import sys
+import os
+
+here = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, here)
+
+from kibom.client import main  # noqa: E402
+
+if __name__ == '__main__':
+    main()
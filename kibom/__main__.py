@@ -22,86 +22,66 @@ from __future__ import print_function
 import sys
 import os
 import argparse
+import cProfile
+import glob
+import io
+import json
 import locale
+import traceback
+from contextlib import redirect_stdout
+from itertools import repeat
 
 from .columns import ColumnList
 from .netlist_reader import netlist
 from .bom_writer import WriteBoM
+from . import bom_writer
 from .preferences import BomPref
 from .version import KIBOM_VERSION
 from . import debug
-from .component import DNF
+from . import timings
+from . import units
 
-VARIANT_FIELD_SEPARATOR = ':'
 
+def readNetlist(input_file, preferences):
+    """
+    Read the netlist file.
+    The same netlist is used for every variant, so it only needs to be read once
+    """
 
-def writeVariant(input_file, output_dir, output_file, variant, preferences):
+    # The nets themselves are not required for the BoM
+    with timings.stage("parse"):
+        return netlist(input_file, prefs=preferences, skipNets=True)
+
+
+def writeVariant(input_file, output_dir, output_file, variant, preferences, net=None, incremental=False, threads=True):
     
     if variant is not None:
         preferences.pcbConfig = variant.strip().lower().split(',')
         
     debug.message("PCB variant:", ", ".join(preferences.pcbConfig))
 
+    timings.setVariant(",".join(preferences.pcbConfig))
+
     # Individual components
     components = []
 
     # Component groups
     groups = []
 
-    # Read out the netlist
-    net = netlist(input_file, prefs=preferences)
+    # Read out the netlist (unless it has already been read)
+    if net is None:
+        net = readNetlist(input_file, preferences)
 
     # Extract the components
-    components = net.getInterestingComponents()
-
-    # Check if complex variant processing is enabled
-    if preferences.complexVariant:
-        # Process the variant fields
-        do_not_populate = []
-        for component in components:
-            fields = component.getFieldNames()
-            for field in fields:
-                try:
-                    # Find fields used for variant
-                    [variant_name, field_name] = field.split(VARIANT_FIELD_SEPARATOR)
-                except ValueError:
-                    [variant_name, field_name] = [field, '']
-
-                if variant_name.lower() in preferences.pcbConfig:
-                    # Variant exist for component
-                    variant_field_value = component.getField(field)
-
-                    # Process no loaded option
-                    if variant_field_value.lower() in DNF and not field_name:
-                        do_not_populate.append(component)
-                        break
-
-                    # Write variant value to target field
-                    component.setField(field_name, variant_field_value)
-
-        # Process component dnp for specified variant
-        if do_not_populate:
-            updated_components = []
-            for component in components:
-                keep = True
-                for dnp in do_not_populate:
-                    # If component reference if found in dnp list: set for removal
-                    if component.getRef() == dnp.getRef():
-                        keep = False
-                        break
-
-                if keep:
-                    # Component not in dnp list
-                    updated_components.append(component)
-                else:
-                    # Component found in dnp list
-                    do_not_populate.remove(component)
-
-            # Finally update components list
-            components = updated_components
+    with timings.stage("components"):
+        if preferences.complexVariant:
+            # Apply the variant fields to the components
+            components = net.getVariantComponents(preferences.pcbConfig)
+        else:
+            components = net.getInterestingComponents()
 
     # Group the components
-    groups = net.groupComponents(components)
+    groups = net.groupComponents(components, incremental=incremental)
 
     columns = ColumnList(preferences.corder)
 
@@ -115,6 +95,36 @@ def writeVariant(input_file, output_dir, output_file, variant, preferences):
         columns.RemoveColumn(ColumnList.COL_GRP_BUILD_QUANTITY)
         debug.info("Removing:", ColumnList.COL_GRP_BUILD_QUANTITY)
 
+    # Multiple output files can be written from the same component groups
+    if isinstance(output_file, (list, tuple)):
+        output_files = output_file
+    else:
+        output_files = [output_file]
+
+    output_files = [getOutputFile(input_file, output_dir, f, variant, preferences, net) for f in output_files]
+
+    for f in output_files:
+        debug.message("Saving BOM File:", f)
+
+    # Without threads, the files are written one after another (the profiler only sees the calling thread)
+    if len(output_files) == 1 or not threads:
+        return all([WriteBoM(f, groups, net, columns.columns, preferences) for f in output_files])
+
+    # Imported here, to keep start up fast for a single output file
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Write each of the output files at the same time
+    with ThreadPoolExecutor(max_workers=len(output_files)) as pool:
+        results = list(pool.map(lambda f: WriteBoM(f, groups, net, columns.columns, preferences), output_files))
+
+    return all(results)
+
+
+def getOutputFile(input_file, output_dir, output_file, variant, preferences, net):
+    """
+    Return the full path of a BoM output file
+    """
+
     if output_file is None:
         output_file = input_file.replace(".xml", ".csv")
 
@@ -125,7 +135,7 @@ def writeVariant(input_file, output_dir, output_file, variant, preferences):
     if output_ext == "":
         output_ext = ".csv"
         debug.info("No extension supplied for output file - using .csv")
-    elif output_ext not in [".xml", ".csv", ".txt", ".tsv", ".html", ".xlsx"]:
+    elif not bom_writer.isSupported(output_ext):
         output_ext = ".csv"
         debug.warning("Unknown extension '{e}' supplied - using .csv".format(e=output_ext))
 
@@ -144,21 +154,22 @@ def writeVariant(input_file, output_dir, output_file, variant, preferences):
     output_file = os.path.join(output_dir, file_name + output_ext)
     output_file = os.path.abspath(output_file)
 
-    debug.message("Saving BOM File:", output_file)
+    return output_file
 
-    return WriteBoM(output_file, groups, net, columns.columns, preferences)
 
-
-def main():
-    locale.setlocale(locale.LC_ALL, '')
+def getParser():
+    """
+    Return the command line argument parser
+    """
 
     prog = 'KiBOM_CLI.py'
     if __name__ == '__main__':
         prog = "python -m kibom"
     parser = argparse.ArgumentParser(prog=prog, description="KiBOM Bill of Materials generator script")
 
-    parser.add_argument("netlist", help='xml netlist file. Use "%%I" when running from within KiCad')
-    parser.add_argument("output", default="", help='BoM output file name.\nUse "%%O" when running from within KiCad to use the default output name (csv file).\nFor e.g. HTML output, use "%%O.html"')
+    parser.add_argument("netlist", nargs='?', default=None, help='xml netlist file. Use "%%I" when running from within KiCad')
+    parser.add_argument("output", nargs='?', default=None, help='BoM output file name.\nUse "%%O" when running from within KiCad to use the default output name (csv file).\nFor e.g. HTML output, use "%%O.html"')
+    parser.add_argument("-o", "--output-file", dest="outputs", action='append', default=[], help='Additional BoM output file name. Can be given multiple times (e.g. -o bom.csv -o bom.html) to write several formats from the same component groups')
     parser.add_argument("-n", "--number", help="Number of boards to build (default = 1)", type=int, default=None)
     parser.add_argument("-v", "--verbose", help="Enable verbose output", action='count')
     parser.add_argument("-r", "--variant", help="Board variant(s), used to determine which components are output to the BoM. To specify multiple variants, with a BOM file exported for each variant, separate variants with the ';' (semicolon) character.", type=str, default=None)
@@ -166,21 +177,93 @@ def main():
     parser.add_argument("--cfg", help="BoM config file (script will try to use 'bom.ini' if not specified here)")
     parser.add_argument("-s", "--separator", help="CSV Separator (default ',')", type=str, default=None)
     parser.add_argument("-k", "--no-colon-sep", help="Don't use : as delimiter in the config file", action='store_true')
+    parser.add_argument("--cache-dir", help="Directory used to cache parsed netlists (overrides 'netlist_cache_dir' in the config file). Use \"\" to disable the cache", type=str, default=None)
+    parser.add_argument("--incremental", help="Reuse the component groups from the previous run, where the components have not changed (requires a cache directory)", action='store_true')
+    parser.add_argument("--timings", help="Print the time taken by each stage of BoM generation", action='store_true')
+    parser.add_argument("--timings-json", help="Write the time taken by each stage of BoM generation to a JSON file", type=str, default=None)
+    parser.add_argument("--profile", help="Write a cProfile (.prof) file for each variant, next to the BoM output file (output files are written one after another)", action='store_true')
+    parser.add_argument("--batch", help="Generate BoMs for many netlists: a glob pattern (e.g. 'projects/**/*.xml') or a manifest file listing one netlist per line. Output files are given with -o", type=str, default=None)
+    parser.add_argument("-j", "--jobs", help="Number of processes used in batch mode (default = number of CPUs)", type=int, default=None)
+    parser.add_argument("--batch-report", help="Write a JSON report of the batch results to this file", type=str, default=None)
+    parser.add_argument("--server", help="Run as a server, generating BoMs for jobs sent by the client (KiBOM_Client.py) to this Unix socket. Use \"-\" to read jobs (JSON lines) from stdin", type=str, default=None)
     parser.add_argument('--version', action='version', version="KiBOM Version: {v}".format(v=KIBOM_VERSION))
 
-    args = parser.parse_args()
+    return parser
+
+
+def main(argv=None):
+    locale.setlocale(locale.LC_ALL, '')
+
+    parser = getParser()
+
+    args = parser.parse_args(argv)
+
+    if args.server is not None:
+        from . import server
+
+        sys.exit(server.BomServer(runJob).serve(args.server))
+
+    sys.exit(run(parser, args))
+
+
+def runJob(argv, server):
+    """
+    Run a job for the server (see server.py), with the given command line arguments.
+    Returns the exit status.
+    """
+
+    parser = getParser()
+
+    args = parser.parse_args(argv)
+
+    if args.server is not None:
+        parser.error("--server cannot be used for a server job")
+
+    return run(parser, args, server=server)
+
+
+def run(parser, args, server=None):
+    """
+    Generate the BoM(s) for the parsed command line arguments.
+    Returns the exit status.
+    """
 
     # Set the global debugging level
     debug.setDebugLevel(int(args.verbose) if args.verbose is not None else debug.MSG_ERROR)
 
     debug.message("KiBOM version {v}".format(v=KIBOM_VERSION))
+
+    if args.batch is not None:
+        if args.netlist is not None or args.output is not None:
+            parser.error("netlist and output arguments cannot be used with --batch (give output files with -o)")
+
+        return runBatch(args)
+
+    if args.netlist is None:
+        parser.error("the following arguments are required: netlist")
+
+    output_files = [os.path.basename(f) for f in ([args.output] if args.output is not None else []) + args.outputs]
+
+    if len(output_files) == 0:
+        debug.error("No output file specified", fail=True)
+
+    return generateBoM(args.netlist, output_files, args, server=server)
+
+
+def generateBoM(input_file, output_files, args, server=None):
+    """
+    Generate the BoM file(s) for a netlist, with the given command line options.
+    If 'server' is given, the preferences are read through the server (which keeps them in memory).
+    Returns the number of errors.
+    """
+
+    timings.enable(args.timings or args.timings_json is not None)
+    timings.reset()
     
-    input_file = os.path.abspath(args.netlist)
+    input_file = os.path.abspath(input_file)
 
     input_dir = os.path.abspath(os.path.dirname(input_file))
 
-    output_file = os.path.basename(args.output)
-
     if args.subdirectory is not None:
         output_dir = args.subdirectory
 
@@ -222,7 +305,10 @@ def main():
     have_cfile = os.path.exists(config_file)
 
     if have_cfile:
-        pref.Read(config_file, no_colon_sep=args.no_colon_sep)
+        if server is not None:
+            pref = server.readPreferences(config_file, args.no_colon_sep)
+        else:
+            pref.Read(config_file, no_colon_sep=args.no_colon_sep)
         debug.message("Configuration file:", config_file)
     else:
         pref.Write(config_file)
@@ -234,6 +320,14 @@ def main():
 
     pref.separatorCSV = args.separator
 
+    if args.cache_dir is not None:
+        pref.cacheDir = os.path.abspath(args.cache_dir) if args.cache_dir else ""
+
+    units.setCacheSize(pref.valueCacheSize)
+
+    if args.incremental and not pref.cacheDir:
+        debug.warning("Incremental mode requires a cache directory (--cache-dir or 'netlist_cache_dir')")
+
     if args.variant is not None:
         variants = args.variant.split(';')
     else:
@@ -243,14 +337,200 @@ def main():
         else:
             variants = [None]
 
+    net = readNetlist(input_file, pref)
+
     # Generate BOMs for each specified variant
     for variant in variants:
-        result = writeVariant(input_file, output_dir, output_file, variant, pref)
+        if args.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        result = writeVariant(input_file, output_dir, output_files, variant, pref, net=net, incremental=args.incremental, threads=not args.profile)
+
+        if args.profile:
+            profiler.disable()
+
+            # Profile is written next to the (first) BoM file for the variant
+            prof_file = os.path.splitext(getOutputFile(input_file, output_dir, output_files[0], variant, pref, net))[0] + ".prof"
+            profiler.dump_stats(prof_file)
+            debug.message("Profile:", prof_file)
+
         if not result:
             debug.error("Error writing variant '{v}'".format(v=variant))
             sys.exit(-1)
 
-    sys.exit(debug.getErrorCount())
+    hits, misses = units.cacheInfo()
+    debug.debug("Value cache: {h} hits, {m} misses".format(h=hits, m=misses))
+
+    if args.timings:
+        debug.message(timings.summary())
+
+    if args.timings_json is not None:
+        timings.writeJSON(args.timings_json, kibom=KIBOM_VERSION, input=input_file, variants=variants)
+
+    return debug.getErrorCount()
+
+
+def findNetlists(batch):
+    """
+    Return the netlist files for --batch.
+    'batch' is either a glob pattern, or a manifest file which lists one netlist per line
+    (relative to the manifest file). Blank lines, and lines starting with '#' are ignored.
+    """
+
+    if os.path.isfile(batch) and not batch.lower().endswith(".xml"):
+        manifest_dir = os.path.dirname(os.path.abspath(batch))
+
+        files = []
+
+        with open(batch, 'r') as f:
+            for line in f:
+                line = line.strip()
+
+                if line and not line.startswith("#"):
+                    files.append(os.path.join(manifest_dir, line))
+    else:
+        files = sorted(glob.glob(batch, recursive=True))
+
+    netlists = []
+
+    for f in files:
+        f = os.path.abspath(f)
+        if f not in netlists:
+            netlists.append(f)
+
+    return netlists
+
+
+def batchOutputFiles(input_file, output_files):
+    """
+    Return the output files for a netlist in batch mode, where "%O" is the name of the netlist (as passed by KiCad)
+    """
+
+    name = os.path.splitext(os.path.basename(input_file))[0]
+
+    return [f.replace("%O", name) if f is not None else None for f in output_files]
+
+
+def batchClashes(netlists, output_files, args):
+    """
+    Return {output file: [netlists]} for any output file which would be written by more than one netlist
+    """
+
+    outputs = {}
+
+    for input_file in netlists:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(input_file)), args.subdirectory or "")
+
+        for f in batchOutputFiles(input_file, output_files):
+            # The default output file is named after the netlist
+            if f is not None:
+                path = os.path.normcase(os.path.normpath(os.path.join(output_dir, f)))
+                outputs.setdefault(path, []).append(input_file)
+
+    return dict([(path, files) for path, files in outputs.items() if len(files) > 1])
+
+
+def batchProject(input_file, output_files, args):
+    """
+    Generate the BoM for one netlist in batch mode (in a worker process).
+    Returns (netlist, success, number of errors, output)
+    """
+
+    debug.setDebugLevel(int(args.verbose) if args.verbose is not None else debug.MSG_ERROR)
+
+    output_files = batchOutputFiles(input_file, output_files)
+
+    # Worker processes are reused for several netlists
+    errors = debug.getErrorCount()
+
+    output = io.StringIO()
+
+    success = True
+
+    try:
+        with redirect_stdout(output):
+            generateBoM(input_file, output_files, args)
+    except SystemExit as e:
+        success = e.code in [0, None]
+    except Exception as e:
+        with redirect_stdout(output):
+            debug.error("Could not generate BoM: {e}".format(e=e))
+        output.write(traceback.format_exc())
+        success = False
+
+    errors = debug.getErrorCount() - errors
+
+    return (input_file, success and errors == 0, errors, output.getvalue())
+
+
+def runBatch(args):
+    """
+    Generate BoMs for each of the netlists given by --batch, using a pool of processes.
+    Each netlist uses its own bom.ini (unless --cfg is given).
+    Returns the exit status: 0 if every BoM was generated without errors, otherwise 1
+    """
+
+    netlists = findNetlists(args.batch)
+
+    if len(netlists) == 0:
+        debug.error("No netlists found for '{b}'".format(b=args.batch), fail=True)
+
+    # Use the default output name (from the netlist) if none is given
+    output_files = [os.path.basename(f) for f in args.outputs] or [None]
+
+    # Each netlist must write its own output files
+    clashes = batchClashes(netlists, output_files, args)
+
+    if clashes:
+        for path, files in sorted(clashes.items()):
+            debug.error("Output '{o}' would be written for {n} netlists: {f}".format(o=path, n=len(files), f=", ".join(files)))
+
+        debug.error("Use %O in the output file names (e.g. -o %O.csv), so that each netlist has its own output files")
+        return 1
+
+    jobs = args.jobs or os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(netlists)))
+
+    debug.message("Batch: {n} netlists, {j} processes".format(n=len(netlists), j=jobs))
+
+    if jobs == 1:
+        results = [batchProject(f, output_files, args) for f in netlists]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(batchProject, netlists, repeat(output_files), repeat(args)))
+
+    failed = [r for r in results if not r[1]]
+
+    for input_file, success, errors, output in results:
+        if args.verbose:
+            print(output.rstrip())
+
+        debug.message("{s}: {f}".format(s="OK" if success else "FAILED", f=input_file))
+
+    # Error report
+    for input_file, success, errors, output in failed:
+        debug.message("")
+        debug.message("Errors for {f} ({n}):".format(f=input_file, n=errors))
+        print(output.rstrip())
+
+    debug.message("")
+    debug.message("Batch: {n} succeeded, {f} failed".format(n=len(results) - len(failed), f=len(failed)))
+
+    if args.batch_report is not None:
+        report = [{
+            "netlist": input_file,
+            "success": success,
+            "errors": errors,
+            "output": output,
+        } for input_file, success, errors, output in results]
+
+        with open(args.batch_report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if failed else 0
 
 
 if __name__ == '__main__':
@@ -1,17 +1,115 @@
 # -*- coding: utf-8 -*-
 
-from .csv_writer import WriteCSV
-from .xml_writer import WriteXML
-from .html_writer import WriteHTML
-from .xlsx_writer import WriteXLSX
-
 from . import columns
 from . import debug
+from . import timings
 from .preferences import BomPref
 
+import importlib
 import os
 import shutil
 
+# File extension -> (format name, module, function) of each writer.
+# Writers are only imported when a file of that format is written.
+WRITERS = {
+    "csv": ("CSV", ".csv_writer", "WriteCSV"),
+    "tsv": ("CSV", ".csv_writer", "WriteCSV"),
+    "txt": ("CSV", ".csv_writer", "WriteCSV"),
+    "htm": ("HTML", ".html_writer", "WriteHTML"),
+    "html": ("HTML", ".html_writer", "WriteHTML"),
+    "xml": ("XML", ".xml_writer", "WriteXML"),
+    "xlsx": ("XLSX", ".xlsx_writer", "WriteXLSX"),
+}
+
+# Entry point group for third party writers. The name of each entry point is
+# the file extension, and it loads a function with the same arguments as
+# WriteCSV(filename, groups, net, headings, head_names, prefs)
+ENTRY_POINT_GROUP = "kibom.writers"
+
+_loaded = {}
+
+_entryPoints = None
+
+
+def _getEntryPoints():
+    """
+    Return the writers registered by other packages (file extension -> entry point)
+    """
+
+    global _entryPoints
+
+    if _entryPoints is None:
+        _entryPoints = {}
+
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            return _entryPoints
+
+        try:
+            eps = entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:
+            # Python < 3.10
+            eps = entry_points().get(ENTRY_POINT_GROUP, [])
+
+        for ep in eps:
+            _entryPoints[ep.name.lower().lstrip(".")] = ep
+
+    return _entryPoints
+
+
+def registerWriter(ext, writer, name=None):
+    """
+    Register a writer function for a file extension
+    """
+
+    ext = ext.lower().lstrip(".")
+
+    WRITERS[ext] = (name or ext.upper(), None, None)
+    _loaded[ext] = writer
+
+
+def isSupported(ext):
+    """
+    Return True if there is a writer for the file extension
+    """
+
+    ext = ext.lower().lstrip(".")
+
+    # Entry points are only searched for extensions which are not built in
+    return ext in WRITERS or ext in _getEntryPoints()
+
+
+def getWriter(ext):
+    """
+    Return (format name, writer function) for a file extension, or None if there is no writer
+    """
+
+    ext = ext.lower().lstrip(".")
+
+    if ext in WRITERS:
+        name, module, function = WRITERS[ext]
+
+        if ext not in _loaded:
+            _loaded[ext] = getattr(importlib.import_module(module, __package__), function)
+
+        return name, _loaded[ext]
+
+    ep = _getEntryPoints().get(ext)
+
+    if ep is None:
+        return None
+
+    try:
+        writer = ep.load()
+    except Exception as e:
+        debug.error("Could not load writer '{n}' for '{ext}' files: {e}".format(n=ep.value, ext=ext, e=e))
+        return None
+
+    registerWriter(ext, writer)
+
+    return WRITERS[ext][0], writer
+
 
 def TmpFileCopy(filename, fmt):
     # Make a tmp copy of a given file
@@ -54,36 +152,18 @@ def WriteBoM(filename, groups, net, headings=columns.ColumnList._COLUMNS_DEFAULT
 
     result = False
 
-    # CSV file writing
-    if ext in ["csv", "tsv", "txt"]:
-        if WriteCSV(filename, groups, net, headings, head_names, prefs):
-            debug.info("CSV Output -> {fn}".format(fn=filename))
-            result = True
-        else:
-            debug.error("Error writing CSV output")
-
-    elif ext in ["htm", "html"]:
-        if WriteHTML(filename, groups, net, headings, head_names, prefs):
-            debug.info("HTML Output -> {fn}".format(fn=filename))
-            result = True
-        else:
-            debug.error("Error writing HTML output")
-
-    elif ext in ["xml"]:
-        if WriteXML(filename, groups, net, headings, head_names, prefs):
-            debug.info("XML Output -> {fn}".format(fn=filename))
-            result = True
-        else:
-            debug.error("Error writing XML output")
+    with timings.stage("write {ext}".format(ext=ext)):
+        writer = getWriter(ext)
 
-    elif ext in ["xlsx"]:
-        if WriteXLSX(filename, groups, net, headings, head_names, prefs):
-            debug.info("XLSX Output -> {fn}".format(fn=filename))
-            result = True
+        if writer is None:
+            debug.error("Unsupported file extension: {ext}".format(ext=ext))
         else:
-            debug.error("Error writing XLSX output")
+            name, write = writer
 
-    else:
-        debug.error("Unsupported file extension: {ext}".format(ext=ext))
+            if write(filename, groups, net, headings, head_names, prefs):
+                debug.info("{name} Output -> {fn}".format(name=name, fn=filename))
+                result = True
+            else:
+                debug.error("Error writing {name} output".format(name=name))
 
     return result
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Thin client for the BoM server (see server.py).
+
+The command line arguments are sent to the server, which generates the BoM.
+If no server is running, the BoM is generated by this process instead.
+
+Only the modules needed to talk to the server are imported, so the client
+starts quickly (KiBoM itself is only imported if there is no server).
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import sys
+
+
+def socketPath():
+    """
+    Return the path of the server socket ($KIBOM_SOCKET, or ~/.kibom.sock)
+    """
+
+    return os.environ.get("KIBOM_SOCKET") or os.path.join(os.path.expanduser("~"), ".kibom.sock")
+
+
+def request(data, path=None):
+    """
+    Send a request to the server, and return the response.
+    Raises OSError if the server is not running.
+    """
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix sockets are not supported")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(path or socketPath())
+        sock.sendall((json.dumps(data) + "\n").encode('utf-8'))
+
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    finally:
+        sock.close()
+
+    if not line:
+        raise OSError("No response from server")
+
+    return json.loads(line.decode('utf-8'))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    try:
+        response = request({"args": argv, "cwd": os.getcwd()})
+    except OSError:
+        # No server, generate the BoM here
+        from .__main__ import main as runMain
+
+        runMain(argv)
+        return
+
+    sys.stdout.write(response.get("output", ""))
+    sys.stdout.flush()
+
+    sys.exit(response.get("status", 1))
+
+
+if __name__ == '__main__':
+    main()
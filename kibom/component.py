@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 
 import re
 import sys
+from collections import OrderedDict
 
 from .columns import ColumnList
 from .preferences import BomPref
@@ -10,6 +11,9 @@ from . import units
 from . import debug
 from .sort import natural_sort
 
+# Splits a reference into (prefix, number, suffix) at the last run of digits (see Component.getRefParts)
+REF_PARTS = re.compile(r"^(.*?)(\d+)(\D*)$", re.DOTALL)
+
 # String matches for marking a component as "do not fit"
 DNF = [
     "dnf",
@@ -37,12 +41,76 @@ DNC = [
 ]
 
 
+# Value which has not been parsed yet (see Component.getParsedValue)
+NOT_PARSED = object()
+
+
+class FitRule():
+    """The fitting rules of a component, parsed once from its 'dnp' property,
+    value and config field (see Component.getFitRule), then evaluated against
+    the current variant(s) (see BomPref.getPcbConfig)
+    """
+
+    __slots__ = ("dnf", "dnc", "include", "exclude", "exclusive")
+
+    def __init__(self, dnp, value, config):
+        value = value.lower()
+        config = config.lower()
+
+        self.dnf = dnp or value in DNF
+        self.dnc = value in DNC
+
+        # +VARIANT options (fitted only in these variants) and -VARIANT options (not fitted in these variants)
+        self.include = frozenset()
+        self.exclude = frozenset()
+        self.exclusive = False
+
+        # Empty config field means part is fitted (and not fixed)
+        if config == "":
+            return
+
+        # Also support space separated list (simple cases)
+        words = config.split(" ")
+        opts = config.split(",")
+
+        self.dnf = self.dnf or any([w in DNF for w in words]) or any([o.strip() in DNF for o in opts])
+        self.dnc = self.dnc or any([w in DNC for w in words]) or any([o in DNC for o in opts])
+
+        self.exclude = frozenset([o.strip()[1:] for o in opts if o.strip().startswith("-")])
+
+        include = [o[1:] for o in opts if o.startswith("+")]
+
+        self.include = frozenset(include)
+        self.exclusive = len(include) > 0
+
+    def isFitted(self, pcbConfig):
+        """Determine if the component is fitted in the given variant(s) (a set)"""
+
+        if self.dnf:
+            return False
+
+        # Exclude components that match a -VARIANT
+        if not self.exclude.isdisjoint(pcbConfig):
+            return False
+
+        # Include components that match a +VARIANT
+        if self.exclusive:
+            return not self.include.isdisjoint(pcbConfig)
+
+        return True
+
+    def isFixed(self):
+        return self.dnc
+
+
 class Component():
     """Class for a component, aka 'comp' in the xml netlist file.
     This component class is implemented by wrapping an xmlElement instance
     with accessors.  The xmlElement is held in field 'element'.
     """
 
+    __slots__ = ("element", "libpart", "prefs", "grouped", "overlay", "_fields", "_fieldNames", "_fitRule", "_refParts", "_sortKeys", "_parsedValue")
+
     def __init__(self, xml_element, prefs=None):
         self.element = xml_element
         self.libpart = None
@@ -55,14 +123,23 @@ class Component():
         # Set to true when this component is included in a component group
         self.grouped = False
 
+        # Field values which replace those in the netlist (see overlayField)
+        self.overlay = {}
+
+        # Resolved field values (see getField)
+        self.resetFields()
+
     # Compare the value of this part, to the value of another part (see if they match)
     def compareValue(self, other):
         # Simple string comparison
         if self.getValue().lower() == other.getValue().lower():
             return True
 
-        # Otherwise, perform a more complicated value comparison
-        if units.compareValues(self.getValue(), other.getValue()):
+        # Otherwise, perform a more complicated value comparison (with the values parsed once)
+        v1 = self.getParsedValue()
+        v2 = other.getParsedValue()
+
+        if v1 and v2 and units.compareValues(v1, v2):
             return True
 
         # Ignore value if both components are connectors
@@ -138,6 +215,7 @@ class Component():
 
     def setLibPart(self, part):
         self.libpart = part
+        self.resetFields()
 
     def getPrefix(self):
         """
@@ -157,49 +235,60 @@ class Component():
 
     def getSuffix(self):
         """
-        Return the reference suffix #
-        e.g. if this component has a reference U12, will return "12"
+        Return the reference number
+        e.g. if this component has a reference U12, will return 12
+        (or None if the reference has no number)
         """
-        
-        suffix = ""
+        return self.getRefParts()[1]
 
-        for c in self.getRef():
-            if c.isalpha():
-                suffix = ""
+    def getRefParts(self):
+        """
+        Return the reference as (prefix, number, suffix), split at the last run of digits
+        e.g. "U12" -> ("U", 12, ""), "U3A" -> ("U", 3, "A"), "R1.2" -> ("R1.", 2, "")
+        A reference without a number is returned as (reference, None, "")
+        """
+
+        if self._refParts is None:
+            ref = self.getRef()
+            match = REF_PARTS.match(ref)
+
+            if match is None:
+                self._refParts = (ref, None, "")
             else:
-                suffix += c
+                prefix, number, suffix = match.groups()
+                self._refParts = (prefix, int(number), suffix)
 
-        return int(suffix)
+        return self._refParts
 
     def getLibPart(self):
         return self.libpart
 
     def getPartName(self):
-        return self.element.get("libsource", "part")
+        return self._get("libsource", "part")
 
     def getLibName(self):
-        return self.element.get("libsource", "lib")
+        return self._get("libsource", "lib")
 
     def getSheetpathNames(self):
-        return self.element.get("sheetpath", "names")
+        return self._get("sheetpath", "names")
 
     def getDescription(self):
         """Extract the 'description' field for this component"""
 
         # Give priority to a user "description" field
-        ret = self.element.get("field", "name", "description")
+        ret = self._get("field", "name", "description")
         if ret:
             return ret
 
-        ret = self.element.get("field", "name", "Description")
+        ret = self._get("field", "name", "Description")
         if ret:
             return ret
 
         try:
-            ret = self.element.get("libsource", "description")
+            ret = self._get("libsource", "description")
         except:
             # Compatibility with old KiCad versions (4.x)
-            ret = self.element.get("field", "name", "description")
+            ret = self._get("field", "name", "description")
 
         if ret == "":
             try:
@@ -207,8 +296,7 @@ class Component():
             except AttributeError:
                 # Raise a good error description here, so the user knows what the culprit component is.
                 # (sometimes libpart is None)
-                raise AttributeError('Could not get description for part {}{}.'.format(self.getPrefix(),
-                                     self.getSuffix()))
+                raise AttributeError('Could not get description for part {}.'.format(self.getRef()))
 
         return ret
 
@@ -217,12 +305,46 @@ class Component():
         v = self.element.getChild("value")
         if v:
             v.setChars(value)
+            self.resetFields()
 
     def getValue(self):
-        return self.element.get("value")
+        return self._get("value")
+
+    def getParsedValue(self):
+        """Return the value parsed by units.compMatch (or None if it is not a numerical value), which is parsed once"""
+        if self._parsedValue is NOT_PARSED:
+            self._parsedValue = units.compMatch(self.getValue())
+
+        return self._parsedValue
+
+    def getSortKey(self, name):
+        """
+        Return the key used to sort by 'name' (see BomPref.sortOrder), which is computed once:
+        prefix -- The reference prefix
+        value -- The value (see getValueSort)
+        reference -- The reference, in natural order
+        Any other name is a field, in natural order
+        """
+
+        if name not in self._sortKeys:
+            if name == "prefix":
+                key = self.getPrefix()
+            elif name == "value":
+                key = self._valueSort()
+            elif name == "reference":
+                key = natural_sort(self.getRef())
+            else:
+                key = natural_sort(self.getField(name))
+
+            self._sortKeys[name] = key
+
+        return self._sortKeys[name]
 
-    # Try to better sort R, L and C components
     def getValueSort(self):
+        return self.getSortKey("value")
+
+    # Try to better sort R, L and C components
+    def _valueSort(self):
         pref = self.getPrefix()
         if pref in 'RLC' or pref == 'RV':
             res = units.compMatch(self.getValue())
@@ -235,68 +357,147 @@ class Component():
                     # milli Ohms
                     value = "{0:15d}".format(int(value * 1000 * mult + 0.1))
                 return value
-        return self.element.get("value")
+        return self._get("value")
 
-    def setField(self, name, value):
-        """ Set the value of the specified field """
+    def _fieldTarget(self, name):
+        """Find where the data for the named field is stored in the netlist.
+        Returns a tuple of (key, element), where key is the (elemName, attribute, attrmatch)
+        used to read the data back. Returns None if the field cannot be found
+        """
 
         name = name.lower()
         # Description field
         doc = self.element.getChild('libsource')
         if doc:
-            for att_name, att_value in doc.attributes.items():
+            for att_name in doc.attributes:
                 if att_name.lower() == name:
-                    doc.attributes[att_name] = value
-                    return value
+                    return (("libsource", att_name, ""), doc)
 
         # Common fields
         field = self.element.getChild(name)
         if field:
-            field.setChars(value)
-            return value
+            return ((name, "", ""), field)
 
         # Other fields
         fields = self.element.getChild('fields')
         if fields:
             for field in fields.getChildren():
-                if field.get('field', 'name').lower() == name:
-                    field.setChars(value)
-                    return value
+                field_name = field.get('field', 'name')
+                if field_name.lower() == name:
+                    return (("field", "name", field_name), field)
 
         return None
 
+    def setField(self, name, value):
+        """ Set the value of the specified field """
+
+        self.resetFields()
+
+        target = self._fieldTarget(name)
+
+        if target is None:
+            return None
+
+        key, element = target
+
+        if key[0] == "libsource":
+            element.setAttribute(key[1], value)
+        else:
+            element.setChars(value)
+
+        return value
+
+    def overlayField(self, name, value):
+        """ Replace the value of the specified field, for this component only.
+        Unlike setField, the netlist itself is not modified """
+
+        self.resetFields()
+
+        target = self._fieldTarget(name)
+
+        if target is None:
+            return None
+
+        self.overlay[target[0]] = value
+
+        return value
+
+    def view(self):
+        """Return a new component which shares the netlist data with this one.
+        Fields can be replaced in the new component using overlayField
+        """
+        c = Component(self.element, prefs=self.prefs)
+        c.setLibPart(self.libpart)
+        c.overlay = dict(self.overlay)
+        return c
+
+    def _get(self, elemName, attribute="", attrmatch=""):
+        """Return data from the netlist element for this component (see xmlElement.get),
+        unless that data has been replaced using overlayField
+        """
+        if self.overlay:
+            key = (elemName, attribute, attrmatch)
+            if key in self.overlay:
+                return self.overlay[key]
+
+        return self.element.get(elemName, attribute, attrmatch)
+
+    def resetFields(self):
+        """Discard any resolved field values (called whenever a field is changed)"""
+        self._fields = {}
+        self._fieldNames = None
+        self._fitRule = None
+        self._refParts = None
+        self._sortKeys = {}
+        self._parsedValue = NOT_PARSED
+
     def getField(self, name, ignoreCase=True, libraryToo=True):
         """Return the value of a field named name. The component is first
         checked for the field, and then the components library part is checked
         for the field. If the field doesn't exist in either, an empty string is
         returned
 
+        Field values are resolved once, and stored against the lowercase field name
+
         Keywords:
         name -- The name of the field to return the value for
         libraryToo --   look in the libpart's fields for the same name if not found
                         in component itself
         """
 
-        fp = self.getFootprint().split(":")
+        name = name.lower()
+
+        if not libraryToo:
+            return self._resolveField(name, libraryToo)
 
-        if name.lower() == ColumnList.COL_REFERENCE.lower():
+        if name not in self._fields:
+            self._fields[name] = self._resolveField(name, libraryToo)
+
+        return self._fields[name]
+
+    def _resolveField(self, name, libraryToo):
+        """Return the value of the field with the given (lowercase) name"""
+
+        if name == ColumnList.COL_REFERENCE.lower():
             return self.getRef().strip()
 
-        elif name.lower() == ColumnList.COL_DESCRIPTION.lower():
+        elif name == ColumnList.COL_DESCRIPTION.lower():
             return self.getDescription().strip()
 
-        elif name.lower() == ColumnList.COL_DATASHEET.lower():
+        elif name == ColumnList.COL_DATASHEET.lower():
             return self.getDatasheet().strip()
 
         # Footprint library is first element
-        elif name.lower() == ColumnList.COL_FP_LIB.lower():
+        elif name == ColumnList.COL_FP_LIB.lower():
+            fp = self.getFootprint().split(":")
             if len(fp) > 1:
                 return fp[0].strip()
             else:
                 # Explicit empty return
                 return ""
 
-        elif name.lower() == ColumnList.COL_FP.lower():
+        elif name == ColumnList.COL_FP.lower():
+            fp = self.getFootprint().split(":")
             if len(fp) > 1:
                 return fp[1].strip()
             elif len(fp) == 1:
@@ -304,27 +505,32 @@ class Component():
             else:
                 return ""
 
-        elif name.lower() == ColumnList.COL_VALUE.lower():
+        elif name == ColumnList.COL_VALUE.lower():
             return self.getValue().strip()
 
-        elif name.lower() == ColumnList.COL_PART.lower():
+        elif name == ColumnList.COL_PART.lower():
             return self.getPartName().strip()
 
-        elif name.lower() == ColumnList.COL_PART_LIB.lower():
+        elif name == ColumnList.COL_PART_LIB.lower():
             return self.getLibName().strip()
 
-        elif name.lower() == ColumnList.COL_SHEETPATH.lower():
+        elif name == ColumnList.COL_SHEETPATH.lower():
             return self.getSheetpathNames().strip()
 
         # Other fields (case insensitive)
-        for f in self.getFieldNames():
-            if f.lower() == name.lower():
-                field = self.element.get("field", "name", f)
+        if self._fieldNames is None:
+            self._fieldNames = {}
+            for f in self.getFieldNames():
+                self._fieldNames.setdefault(f.lower(), f)
 
-                if field == "" and libraryToo:
-                    field = self.libpart.getField(f)
+        if name in self._fieldNames:
+            f = self._fieldNames[name]
+            field = self._get("field", "name", f)
 
-                return field.strip()
+            if field == "" and libraryToo:
+                field = self.libpart.getField(f)
+
+            return field.strip()
 
         # Could not find a matching field
         return ""
@@ -347,106 +553,52 @@ class Component():
         return fieldNames
 
     def getRef(self):
-        return self.element.get("comp", "ref")
+        return self._get("comp", "ref")
 
-    def isFitted(self):
-        """ Determine if a component is FITTED or not """
+    def getFitRule(self):
+        """ Return the fitting rules of the component (parsed once, see FitRule) """
 
-        # First, check for the 'dnp' attribute (added in KiCad 7.0)
-        for child in self.element.getChildren():
-            if child.name == 'property':
-                name = child.attributes.get('name', '').lower()
-                if name == 'dnp' or name == 'exclude_from_bom':
-                    return False
+        if self._fitRule is None:
+            # Check for the 'dnp' attribute (added in KiCad 7.0)
+            dnp = False
 
-        # Check the value field first
-        if self.getValue().lower() in DNF:
-            return False
+            for child in self.element.getChildren():
+                if child.name == 'property':
+                    name = child.attributes.get('name', '').lower()
+                    if name == 'dnp' or name == 'exclude_from_bom':
+                        dnp = True
+                        break
 
-        check = self.getField(self.prefs.configField).lower()
-        # Empty value means part is fitted
-        if check == "":
-            return True
+            self._fitRule = FitRule(dnp, self.getValue(), self.getField(self.prefs.configField))
 
-        # Also support space separated list (simple cases)
-        opts = check.split(" ")
-        for opt in opts:
-            if opt.lower() in DNF:
-                return False
+        return self._fitRule
 
-        # Variants logic
-        opts = check.split(",")
-        # Exclude components that match a -VARIANT
-        for opt in opts:
-            opt = opt.strip()
-            # Any option containing a DNF is not fitted
-            if opt in DNF:
-                return False
-            # Options that start with '-' are explicitly removed from certain configurations
-            if opt.startswith("-") and opt[1:] in self.prefs.pcbConfig:
-                return False
-        # Include components that match +VARIANT
-        exclusive = False
-        for opt in opts:
-            # Options that start with '+' are fitted only for certain configurations
-            if opt.startswith("+"):
-                exclusive = True
-                if opt[1:] in self.prefs.pcbConfig:
-                    return True
-        # No match
-        return not exclusive
+    def isFitted(self):
+        """ Determine if a component is FITTED or not """
+        return self.getFitRule().isFitted(self.prefs.getPcbConfig())
 
     def isFixed(self):
         """ Determine if a component is FIXED or not.
             Fixed components shouldn't be replaced without express authorization """
-
-        # Check the value field first
-        if self.getValue().lower() in DNC:
-            return True
-
-        check = self.getField(self.prefs.configField).lower()
-        # Empty is not fixed
-        if check == "":
-            return False
-
-        opts = check.split(" ")
-        for opt in opts:
-            if opt.lower() in DNC:
-                return True
-
-        opts = check.split(",")
-        for opt in opts:
-            if opt.lower() in DNC:
-                return True
-
-        return False
+        return self.getFitRule().isFixed()
 
     # Test if this part should be included, based on any regex expressions provided in the preferences
     def testRegExclude(self):
 
-        for reg in self.prefs.regExcludes:
-
-            if type(reg) is list and len(reg) == 2:
-                field_name, regex = reg
-                field_value = self.getField(field_name)
+        match = self.prefs.getRegExcludeFilter().match(self)
 
-                # Attempt unicode escaping...
-                # Filthy hack
-                try:
-                    regex = regex.decode("unicode_escape")
-                except:
-                    pass
+        if match is not None:
+            field_name, regex, field_value = match
 
-                if re.search(regex, field_value, flags=re.IGNORECASE) is not None:
-                    debug.info("Excluding '{ref}': Field '{field}' ({value}) matched '{reg}'".format(
-                        ref=self.getRef(),
-                        field=field_name,
-                        value=field_value,
-                        reg=regex).encode('utf-8')
-                    )
+            debug.info("Excluding '{ref}': Field '{field}' ({value}) matched '{reg}'".format(
+                ref=self.getRef(),
+                field=field_name,
+                value=field_value,
+                reg=regex).encode('utf-8')
+            )
 
-                    # Found a match
-                    return True
+            # Found a match
+            return True
 
         # Default, could not find any matches
         return False
@@ -456,90 +608,88 @@ class Component():
         if len(self.prefs.regIncludes) == 0:  # Nothing to match against
             return True
 
-        for reg in self.prefs.regIncludes:
-
-            if type(reg) is list and len(reg) == 2:
-                field_name, regex = reg
-                field_value = self.getField(field_name)
-
-                debug.info(field_name, field_value, regex)
-
-                if re.search(regex, field_value, flags=re.IGNORECASE) is not None:
-
-                    # Found a match
-                    return True
-
-        # Default, could not find a match
-        return False
+        return self.prefs.getRegIncludeFilter().match(self) is not None
 
     def getFootprint(self, libraryToo=True):
-        ret = self.element.get("footprint")
+        ret = self._get("footprint")
         if ret == "" and libraryToo:
             if self.libpart:
                 ret = self.libpart.getFootprint()
         return ret
 
     def getDatasheet(self, libraryToo=True):
-        ret = self.element.get("datasheet")
+        ret = self._get("datasheet")
         if ret == "" and libraryToo:
             ret = self.libpart.getDatasheet()
         return ret
 
     def getTimestamp(self):
-        return self.element.get("tstamp")
+        return self._get("tstamp")
 
 
-class joiner:
-    def __init__(self):
-        self.stack = []
+def compactRefs(components, sep, N=None, dash='-'):
+    """
+    Return the references of the components (in order), with runs of consecutive
+    references written as ranges e.g. "C1-C4, C7". References are consecutive if
+    they differ only in their number, by one (see Component.getRefParts).
+    N -- Start a new line after every N references (Optional)
+    """
 
-    def add(self, P, N):
-        
-        if self.stack == []:
-            self.stack.append(((P, N), (P, N)))
-            return
+    # [first, last] reference of each range (last is None for a single reference)
+    ranges = []
 
-        S, E = self.stack[-1]
+    previous = None
 
-        if N == E[1] + 1:
-            self.stack[-1] = (S, (P, N))
-        else:
-            self.stack.append(((P, N), (P, N)))
+    for c in components:
+        prefix, number, suffix = parts = c.getRefParts()
 
-    def flush(self, sep, N=None, dash='-'):
+        if previous is not None and number is not None and previous[1] is not None and \
+                number == previous[1] + 1 and prefix == previous[0] and suffix == previous[2]:
+            ranges[-1][1] = c.getRef()
+        else:
+            ranges.append([c.getRef(), None])
 
-        refstr = u''
-        c = 0
+        previous = parts
 
-        for Q in self.stack:
-            if bool(N) and c != 0 and c % N == 0:
-                refstr += u'\n'
-            elif c != 0:
-                refstr += sep + " "
+    refstr = u''
+    c = 0
 
-            S, E = Q
+    for first, last in ranges:
+        if bool(N) and c != 0 and c % N == 0:
+            refstr += u'\n'
+        elif c != 0:
+            refstr += sep + " "
 
-            if S == E:
-                refstr += "%s%d" % S
+        if last is None:
+            refstr += first
+            c += 1
+        else:
+            # Do we have space?
+            if bool(N) and (c + 1) % N == 0:
+                refstr += u'\n'
                 c += 1
-            else:
-                # Do we have space?
-                if bool(N) and (c + 1) % N == 0:
-                    refstr += u'\n'
-                    c += 1
 
-                refstr += "%s%d%s%s%d" % (S[0], S[1], dash, E[0], E[1])
-                c += 2
-        return refstr
+            refstr += first + dash + last
+            c += 2
 
+    return refstr
 
-class ComponentGroup():
 
+class ComponentGroup():
     """
     Initialize the group with no components, and default fields
     """
+
+    __slots__ = ("components", "fields", "prefs", "_aggregates", "_fieldValues")
+
     def __init__(self, prefs=None):
         self.components = []
+
+        # (count, fitted, fixed) of the group (see _getAggregates)
+        self._aggregates = None
+
+        # {field: {normalized value: value}} waiting to be merged (see updateField)
+        self._fieldValues = {}
         self.fields = dict.fromkeys(ColumnList._COLUMNS_DEFAULT)  # Columns loaded from KiCad
 
         if not prefs:
@@ -557,8 +707,32 @@ class ComponentGroup():
         
         return u''.join((self.fields[field]))
 
+    def _getAggregates(self):
+        """
+        Return (count, fitted, fixed) for the group, which are computed once
+        and cached until a component is added
+        """
+
+        if self._aggregates is None:
+            self._aggregates = (
+                len(self.components),
+                any([c.isFitted() for c in self.components]),
+                any([c.isFixed() for c in self.components]),
+            )
+
+        return self._aggregates
+
     def getCount(self):
-        return len(self.components)
+        return self._getAggregates()[0]
+
+    def getFittedCount(self):
+        # Number of components which are fitted (all or none of the group)
+        count, fitted, fixed = self._getAggregates()
+        return count if fitted else 0
+
+    def getBuildCount(self):
+        # Number of components required to build all of the boards
+        return self.getFittedCount() * self.prefs.boards
 
     # Test if a given component fits in this group
     def matchComponent(self, c):
@@ -584,17 +758,27 @@ class ComponentGroup():
         # Add a component to the group
 
         if len(self.components) == 0:
-            self.components.append(c)
+            self.appendComponent(c)
         elif self.containsComponent(c):
             return
         elif self.matchComponent(c):
-            self.components.append(c)
+            self.appendComponent(c)
+
+    def appendComponent(self, c):
+        # Add a component which is already known to match this group
+        self.components.append(c)
+        self._aggregates = None
+
+    def setComponents(self, components):
+        # Replace the components of the group
+        self.components = components
+        self._aggregates = None
 
     def isFitted(self):
-        return any([c.isFitted() for c in self.components])
+        return self._getAggregates()[1]
 
     def isFixed(self):
-        return any([c.isFixed() for c in self.components])
+        return self._getAggregates()[2]
 
     def getRefs(self):
         # Return a list of the components
@@ -602,20 +786,19 @@ class ComponentGroup():
         return separator.join([c.getRef() for c in self.components])
 
     def getAltRefs(self):
-        S = joiner()
-
-        for n in self.components:
-            P, N = (n.getPrefix(), n.getSuffix())
-            S.add(P, N)
-
-        return S.flush(self.prefs.refSeparator)
+        # Return the components, with ranges of references e.g. "C1-C4"
+        return compactRefs(self.components, self.prefs.refSeparator)
 
     # Sort the components in correct order
     def sortComponents(self):
-        self.components = sorted(self.components, key=lambda c: natural_sort(c.getRef()))
+        self.components = sorted(self.components, key=lambda c: c.getSortKey("reference"))
 
     # Update a given field, based on some rules and such
     def updateField(self, field, fieldData):
+        """
+        Add a value to a field. Distinct values (ignoring case) are kept in order,
+        and joined when the fields are merged (see mergeFields).
+        """
 
         # Protected fields cannot be overwritten
         if field in ColumnList._COLUMNS_PROTECTED:
@@ -626,18 +809,37 @@ class ComponentGroup():
         elif fieldData == "" or fieldData is None:
             return
 
-        if (field not in self.fields.keys()) or (self.fields[field] is None) or (self.fields[field] == ""):
-            self.fields[field] = fieldData
-        elif fieldData.lower() in self.fields[field].lower():
-            return
-        else:
-            if field != self.prefs.configField:
-                debug.warning("Field conflict: ({refs}) [{name}] : '{flds}' <- '{fld}'".format(
+        values = self._fieldValues.get(field)
+
+        if values is None:
+            values = OrderedDict()
+
+            # Start with the current value, if any
+            if self.fields.get(field):
+                values[self.fields[field].strip().lower()] = self.fields[field]
+
+            self._fieldValues[field] = values
+
+        key = fieldData.strip().lower()
+
+        if key not in values:
+            values[key] = fieldData
+
+    def mergeFields(self):
+        """
+        Join the values added by updateField, with a warning for each field which has conflicting values
+        """
+
+        for field, values in self._fieldValues.items():
+            if len(values) > 1 and field != self.prefs.configField:
+                debug.warning("Field conflict: ({refs}) [{name}] : '{flds}'".format(
                     refs=self.getRefs(),
                     name=field,
-                    flds=self.fields[field],
-                    fld=fieldData).encode('utf-8'))
-            self.fields[field] += " " + fieldData
+                    flds="', '".join(values.values())).encode('utf-8'))
+
+            self.fields[field] = " ".join(values.values())
+
+        self._fieldValues = {}
 
     def updateFields(self, usealt=False, wrapN=None):
         for c in self.components:
@@ -649,19 +851,21 @@ class ComponentGroup():
 
                 self.updateField(f, c.getField(f))
 
+        self.mergeFields()
+
         # Update 'global' fields
         if usealt:
             self.fields[ColumnList.COL_REFERENCE] = self.getAltRefs()
         else:
             self.fields[ColumnList.COL_REFERENCE] = self.getRefs()
 
-        q = self.getCount()
+        q, fitted, fixed = self._getAggregates()
         self.fields[ColumnList.COL_GRP_QUANTITY] = "{n}{dnf}{dnc}".format(
             n=q,
-            dnf=" (DNF)" if not self.isFitted() else "",
-            dnc=" (DNC)" if self.isFixed() else "")
+            dnf=" (DNF)" if not fitted else "",
+            dnc=" (DNC)" if fixed else "")
 
-        self.fields[ColumnList.COL_GRP_BUILD_QUANTITY] = str(q * self.prefs.boards) if self.isFitted() else "0"
+        self.fields[ColumnList.COL_GRP_BUILD_QUANTITY] = str(self.getBuildCount())
         self.fields[ColumnList.COL_VALUE] = self.components[0].getValue()
         self.fields[ColumnList.COL_PART] = self.components[0].getPartName()
         self.fields[ColumnList.COL_PART_LIB] = self.components[0].getLibName()
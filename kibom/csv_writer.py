@@ -32,8 +32,8 @@ def WriteCSV(filename, groups, net, headings, head_names, prefs):
 
     nGroups = len(groups)
     nTotal = sum([g.getCount() for g in groups])
-    nFitted = sum([g.getCount() for g in groups if g.isFitted()])
-    nBuild = nFitted * prefs.boards
+    nFitted = sum([g.getFittedCount() for g in groups])
+    nBuild = sum([g.getBuildCount() for g in groups])
 
     if (sys.version_info[0] >= 3):
         f = open(filename, "w", encoding='utf-8')
@@ -35,6 +35,11 @@ def getErrorCount():
     return ERR_COUNT
 
 
+def resetErrorCount():
+    global ERR_COUNT
+    ERR_COUNT = 0
+
+
 def _msg(prefix, *arg):
     """
     Display a message with the given color.
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+This file contains the functions used to sort components into groups.
+
+Two components belong in the same group when Component.__eq__ says they are
+equal. Rather than comparing every component against every existing group,
+each component is reduced (once) to a hashable key and the groups are then
+built with a single dictionary pass.
+
+The key is split into two parts:
+
+- A 'bucket' key, made of the properties which must match exactly:
+  fitted / fixed state, part name (or part alias class) and any generic
+  grouping fields (compared case-insensitively)
+- A 'value' key, made of the normalized numeric value and units
+
+Some value comparisons are not transitive, and cannot be reduced to a key:
+
+- Connectors (with groupConnectors) match on any value, but also match
+  non-connectors with the same value
+- A value without units (e.g. '10K') matches the same value with any units
+  (e.g. '10KR' and '10KF'), which do not match each other
+- '1M' and '1m' match as strings, but are not the same value
+- A part name which appears in more than one alias list
+
+If any of these are found within a bucket, that bucket is grouped by
+comparing each component against the existing groups (as Component.__eq__
+does). If a part name appears in more than one alias list, this is done for
+all of the components. Either way the groups are the same as they would be
+if every component were compared against every group.
+
+"""
+
+from __future__ import unicode_literals
+
+from .columns import ColumnList
+from .component import ComponentGroup
+
+
+def groupPairwise(components, prefs):
+    """
+    Sort components into groups, by comparing each component against the
+    first component in each existing group.
+    Returns a list of groups, in the order that they were created.
+    """
+
+    groups = []
+
+    for c in components:
+
+        found = False
+
+        for g in groups:
+            if g.matchComponent(c):
+                g.addComponent(c)
+                found = True
+                break
+
+        if not found:
+            g = ComponentGroup(prefs=prefs)  # Pass down the preferences
+            g.addComponent(c)
+            groups.append(g)
+
+    return groups
+
+
+def aliasClasses(prefs):
+    """
+    Return a dict of part name -> index of the alias list which contains it.
+    Returns None if any part name appears in more than one alias list.
+    """
+
+    classes = {}
+
+    for idx, alias in enumerate(prefs.aliases):
+        for name in alias:
+            if classes.get(name, idx) != idx:
+                return None
+
+            classes[name] = idx
+
+    return classes
+
+
+def bucketKey(component, prefs, aliases):
+    """
+    Return the part of the grouping key which must match exactly
+    """
+
+    key = [component.isFitted(), component.isFixed()]
+
+    for field in prefs.groups:
+        field = field.lower()
+
+        if field == ColumnList.COL_VALUE.lower():
+            # Values are handled by valueKeys()
+            continue
+
+        elif field == ColumnList.COL_PART.lower():
+            name = component.getPartName().lower()
+            if name in aliases:
+                key.append(("alias", aliases[name]))
+            else:
+                key.append(("part", name))
+
+        else:
+            value = component.getField(field).lower()
+
+            # Blank fields never match (unless merging blank fields)
+            if value == "" and not prefs.mergeBlankFields:
+                value = object()
+
+            key.append(value)
+
+    return tuple(key)
+
+
+def valueKeys(components, prefs):
+    """
+    Return a list of value keys (one for each component), or None if the
+    values cannot be compared with a key.
+    """
+
+    connectors = [prefs.groupConnectors and 'connector' in c.getLibName().lower() for c in components]
+
+    if all(connectors):
+        # Connector values are ignored
+        return [None for c in components]
+    elif any(connectors):
+        return None
+
+    keys = []
+
+    # Lowercase value -> numerical key
+    strings = {}
+
+    # Numerical value -> set of units
+    numbers = {}
+
+    for c in components:
+        value = c.getValue()
+
+        result = c.getParsedValue()
+
+        if result:
+            val, mult, unit = result
+            number = "{0:.15f}".format(val * 1.0 * mult)
+
+            numbers.setdefault(number, set()).add(unit)
+            key = (number, unit)
+        else:
+            key = None
+
+        # Values which are the same (ignoring case) must have the same key
+        if strings.setdefault(value.lower(), key) != key:
+            return None
+
+        keys.append((value.lower(), key))
+
+    # A value with no units matches the same value with (at most one) units
+    wildcards = {}
+
+    for number, found in numbers.items():
+        if None in found:
+            found = found - set([None])
+            if len(found) > 1:
+                return None
+            elif len(found) == 1:
+                wildcards[number] = found.pop()
+
+    ret = []
+
+    for value, key in keys:
+        if key is None:
+            ret.append(("str", value))
+        else:
+            number, unit = key
+            if unit is None:
+                unit = wildcards.get(number, None)
+            ret.append(("num", number, unit))
+
+    return ret
+
+
+def groupComponents(components, prefs):
+    """
+    Sort components into groups.
+    Returns a list of groups, in the order that they were created.
+    """
+
+    aliases = aliasClasses(prefs)
+
+    if aliases is None or len(prefs.groups) == 0:
+        return groupPairwise(components, prefs)
+
+    group_value = ColumnList.COL_VALUE.lower() in [g.lower() for g in prefs.groups]
+
+    buckets = {}
+
+    for c in components:
+        buckets.setdefault(bucketKey(c, prefs, aliases), []).append(c)
+
+    # Position of each component in the original list
+    position = {}
+    for idx, c in enumerate(components):
+        position.setdefault(id(c), idx)
+
+    groups = []
+
+    for bucket in buckets.values():
+
+        if group_value:
+            keys = valueKeys(bucket, prefs)
+
+            if keys is None:
+                groups += groupPairwise(bucket, prefs)
+                continue
+        else:
+            keys = [None for c in bucket]
+
+        # Value key -> (group, references in group)
+        found = {}
+
+        for c, key in zip(bucket, keys):
+            if key not in found:
+                g = ComponentGroup(prefs=prefs)  # Pass down the preferences
+                groups.append(g)
+                found[key] = (g, set())
+
+            g, refs = found[key]
+
+            # A group cannot contain the same reference twice
+            if c.getRef() not in refs:
+                refs.add(c.getRef())
+                g.appendComponent(c)
+
+    # Groups are returned in the order in which they would be created
+    groups.sort(key=lambda g: position[id(g.components[0])])
+
+    return groups
@@ -49,8 +49,8 @@ def WriteHTML(filename, groups, net, headings, head_names, prefs):
 
     nGroups = len(groups)
     nTotal = sum([g.getCount() for g in groups])
-    nFitted = sum([g.getCount() for g in groups if g.isFitted()])
-    nBuild = nFitted * prefs.boards
+    nFitted = sum([g.getFittedCount() for g in groups])
+    nBuild = sum([g.getBuildCount() for g in groups])
 
     link_datasheet = prefs.as_link
     link_digikey = None
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental grouping, using the groups from the previous run (see --incremental)
+
+Components are sorted into the same buckets as grouping.groupComponents()
+(see grouping.bucketKey). Groups never span buckets, so the groups in a
+bucket depend only on the components in that bucket.
+
+Each bucket is identified by the signatures of its components: the
+reference and timestamp of each component, along with all of its netlist
+data (and that of its library part). If a bucket is identical to a bucket
+from the previous run, its groups (components, order and fields) are
+restored from the previous run. Otherwise the bucket is grouped, sorted and
+its fields updated as normal. Either way the groups are the same as a full
+run would produce.
+
+The previous groups are stored in the netlist cache directory, for each
+design and set of preferences (including the variant). Each stored bucket
+key and bucket is only checked when it is used (see checkState), and is
+ignored if it is not valid.
+"""
+
+from __future__ import print_function
+
+import hashlib
+
+from .component import ComponentGroup
+from .version import KIBOM_VERSION
+from . import grouping
+from . import netlist_cache
+from . import debug
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _isString(value):
+    return isinstance(value, type(u""))
+
+
+# Types of the values in the stored state (the types are checked as a set, as there are many values)
+_STRING_TYPES = frozenset([type(u"")])
+_KEY_TYPES = frozenset([bool, type(u"")])
+_FIELD_TYPES = frozenset([type(u""), type(None)])
+_SEQUENCE_TYPES = (list, tuple)
+
+
+def _checkKey(key):
+    """
+    Return a bucket key (see grouping.bucketKey) loaded from the cache, as a tuple
+    """
+
+    if type(key) not in _SEQUENCE_TYPES:
+        raise ValueError("Invalid bucket key")
+
+    result = []
+
+    for k in key:
+        if type(k) not in _KEY_TYPES:
+            # ("alias", index) or ("part", name)
+            if type(k) not in _SEQUENCE_TYPES or len(k) != 2 or not _isString(k[0]) or not isinstance(k[1], (int, type(u""))):
+                raise ValueError("Invalid bucket key")
+            k = tuple(k)
+
+        result.append(k)
+
+    return tuple(result)
+
+
+def _checkGroup(group):
+    """
+    Return the stored (first reference, [references], fields) of a group loaded from the cache
+    """
+
+    if type(group) not in _SEQUENCE_TYPES or len(group) != 3:
+        raise ValueError("Invalid group")
+
+    first, refs, fields = group
+
+    if not _isString(first) or type(refs) is not list or not set(map(type, refs)) <= _STRING_TYPES:
+        raise ValueError("Invalid group references")
+
+    # (The field names are JSON object keys, which are always strings)
+    if type(fields) is not dict or not set(map(type, fields.values())) <= _FIELD_TYPES:
+        raise ValueError("Invalid group fields")
+
+    return (first, refs, fields)
+
+
+def checkState(state):
+    """
+    Check the state loaded from the cache (see groupComponents), and return it.
+    Raises ValueError if the state does not have the expected shape.
+
+    Only the outer dicts are checked here. Each stored entry is checked when
+    it is used (see _previousKey and _previousGroups), so an invalid entry
+    is grouped again rather than discarding the whole state.
+    """
+
+    if not isinstance(state, dict):
+        raise ValueError("Invalid state")
+
+    components = state.get("components", {})
+    buckets = state.get("buckets", {})
+
+    if not isinstance(components, dict) or not isinstance(buckets, dict):
+        raise ValueError("Invalid state")
+
+    return {
+        "components": components,
+        "buckets": buckets,
+    }
+
+
+def _previousKey(previous_keys, signature):
+    """
+    Return the stored bucket key of a component, or None if there is none (or it is not valid)
+    """
+
+    key = previous_keys.get(signature)
+
+    if key is None:
+        return None
+
+    try:
+        return _checkKey(key)
+    except ValueError:
+        return None
+
+
+def _previousGroups(previous_groups, signature, refs):
+    """
+    Return the stored groups of a bucket, or None if there are none
+    (or they are not valid for the components 'refs' in the bucket)
+    """
+
+    groups = previous_groups.get(signature)
+
+    if groups is None:
+        return None
+
+    try:
+        if not isinstance(groups, (list, tuple)):
+            raise ValueError("Invalid bucket")
+
+        groups = [_checkGroup(g) for g in groups]
+    except ValueError:
+        return None
+
+    # Every component in the bucket must be in exactly one group
+    group_refs = [ref for first, group_refs, fields in groups for ref in group_refs]
+
+    if len(group_refs) != len(refs) or set(group_refs) != set(refs):
+        return None
+
+    if not all([first in group_refs for first, group_refs, fields in groups]):
+        return None
+
+    return groups
+
+
+def stateKey(net, prefs):
+    """
+    Return the cache key for the groups of a design, with the given preferences
+    """
+
+    settings = prefs.groupingSettings()
+
+    return hashlib.sha256(repr(("groups", KIBOM_VERSION, net.design.get("source"), settings)).encode('utf-8')).hexdigest()
+
+
+def _elementStrings(element, strings):
+    """
+    Add the name, attributes, text and children of an element (and all of its children) to a list of strings.
+    The number of attributes and children are included, so the strings can be joined with a character
+    which is never in a netlist (XML does not allow NUL).
+    """
+
+    attributes = element.attributes
+
+    strings += (element.name, str(len(attributes)))
+
+    if attributes:
+        for name in sorted(attributes):
+            strings += (name, attributes[name])
+
+    strings += (element.chars, str(len(element.children)))
+
+    for child in element.children:
+        _elementStrings(child, strings)
+
+
+def componentSignature(component, libparts):
+    """
+    Return a digest of everything about a component which can affect the groups.
+    'libparts' caches the digest of each library part.
+    """
+
+    part = component.getLibPart()
+
+    if part is None:
+        part_digest = ""
+    else:
+        if id(part) not in libparts:
+            strings = []
+            _elementStrings(part.element, strings)
+            libparts[id(part)] = _digest(u"\0".join(strings).encode('utf-8'))
+        part_digest = libparts[id(part)]
+
+    # The component data includes the reference and timestamp
+    strings = [part_digest, str(len(component.overlay))]
+
+    for key, value in sorted(component.overlay.items()):
+        strings += key
+        strings.append(value)
+
+    _elementStrings(component.element, strings)
+
+    return _digest(u"\0".join(strings).encode('utf-8'))
+
+
+def groupComponents(components, prefs, previous):
+    """
+    Sort components into groups (with sorted components and updated fields),
+    reusing the groups from 'previous' where possible.
+    Returns (groups, state), where 'state' is passed as 'previous' to the next run.
+    """
+
+    previous_keys = previous.get("components", {})
+    previous_groups = previous.get("buckets", {})
+
+    # Component signature -> bucket key
+    keys = {}
+
+    # Bucket signature -> [(first reference, [references], fields)] for each group
+    state_groups = {}
+
+    aliases = grouping.aliasClasses(prefs)
+
+    libparts = {}
+
+    signatures = [componentSignature(c, libparts) for c in components]
+
+    if aliases is None or len(prefs.groups) == 0:
+        # Everything is grouped together (see grouping.groupComponents)
+        buckets = [list(zip(components, signatures))]
+    else:
+        found = {}
+
+        for c, signature in zip(components, signatures):
+            # The bucket key of an unchanged component is the same as before
+            key = _previousKey(previous_keys, signature)
+
+            if key is None:
+                key = grouping.bucketKey(c, prefs, aliases)
+
+            # Blank fields (which never match) cannot be stored
+            if not any([type(k) is object for k in key]):
+                keys[signature] = key
+
+            found.setdefault(key, []).append((c, signature))
+
+        buckets = found.values()
+
+    # Position of each component in the original list
+    position = {}
+    for idx, c in enumerate(components):
+        position.setdefault(id(c), idx)
+
+    # (position of the first component added to the group, group)
+    groups = []
+
+    reused = 0
+
+    for bucket in buckets:
+        signature = _digest("".join([s for c, s in bucket]).encode('ascii'))
+
+        refs = dict([(c.getRef(), c) for c, s in bucket])
+
+        # Groups are stored by reference, which must be unique
+        unique = len(refs) == len(bucket)
+
+        bucket_groups = []
+
+        previous_bucket = _previousGroups(previous_groups, signature, refs) if unique else None
+
+        if previous_bucket is not None:
+            for first, group_refs, fields in previous_bucket:
+                g = ComponentGroup(prefs=prefs)
+                g.setComponents([refs[ref] for ref in group_refs])
+                g.fields = dict(fields)
+
+                bucket_groups.append((refs[first], g))
+
+            reused += 1
+
+        else:
+            for g in grouping.groupComponents([c for c, s in bucket], prefs):
+                first = g.components[0]
+
+                g.sortComponents()
+                g.updateFields(prefs.useAlt)
+
+                bucket_groups.append((first, g))
+
+        if unique:
+            state_groups[signature] = [(first.getRef(), [c.getRef() for c in g.components], g.fields) for first, g in bucket_groups]
+
+        groups += [(position[id(first)], g) for first, g in bucket_groups]
+
+    debug.info("Incremental grouping: {r} of {n} buckets unchanged".format(r=reused, n=len(buckets)))
+
+    # Groups are returned in the order in which they would be created
+    groups.sort(key=lambda g: g[0])
+
+    state = {
+        "components": keys,
+        "buckets": state_groups,
+    }
+
+    return [g for idx, g in groups], state
+
+
+def loadState(net, prefs):
+    """
+    Return the groups stored by the previous run (or an empty dict)
+    """
+
+    state = netlist_cache.load(prefs.cacheDir, stateKey(net, prefs), check=checkState)
+
+    if state is None:
+        return {}
+
+    return state
+
+
+def saveState(net, prefs, state):
+    netlist_cache.store(prefs.cacheDir, stateKey(net, prefs), state, prefs.cacheSize * 1024 * 1024)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of parsed netlists.
+
+The element tree of a parsed netlist is stored as nested tuples of
+(name, attributes, chars, children), keyed by a hash of the netlist file
+contents and the KiBoM (and Python) version. Reading an unchanged netlist
+again loads the tree from the cache, without parsing any XML.
+
+Entries are stored as JSON (never pickled), as anyone who can write to the
+cache directory could otherwise run code. Entries which do not have the
+expected shape (see checkRecords) are ignored.
+
+The oldest (least recently used) entries are removed when the total size
+of the cache exceeds the size limit.
+
+Entries can also be kept in memory (see MEMORY_SIZE), for a process which
+generates many BoMs (see server.py).
+"""
+
+from __future__ import print_function
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+from .version import KIBOM_VERSION
+from . import debug
+
+CACHE_EXT = ".kibomcache"
+
+# Stored in the cache key, so entries in an older format are not read
+CACHE_FORMAT = "json"
+
+# Number of entries kept in memory (0 to disable)
+MEMORY_SIZE = 0
+
+_memory = OrderedDict()
+
+
+def cacheKey(fname, skipNets=False):
+    """
+    Return the cache key for a netlist file
+    """
+
+    h = hashlib.sha256()
+
+    h.update("{v}:{p}:{f}:{s}:".format(v=KIBOM_VERSION, p=sys.version_info[:2], f=CACHE_FORMAT, s=bool(skipNets)).encode('utf-8'))
+
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def treeRecords(element):
+    """
+    Return the (compact) records for an element and all of its children
+    """
+
+    return (
+        element.name,
+        dict(element.attributes) if element.attributes else None,
+        element.chars,
+        tuple([treeRecords(child) for child in element.children]),
+    )
+
+
+def _isString(value):
+    return isinstance(value, type(u""))
+
+
+def checkRecords(records):
+    """
+    Check the records loaded for an element tree (see treeRecords), and return them as tuples.
+    Raises ValueError if the records do not have the expected shape.
+    """
+
+    if not isinstance(records, (list, tuple)) or len(records) != 4:
+        raise ValueError("Invalid element record")
+
+    name, attributes, chars, children = records
+
+    if not _isString(name) or not _isString(chars) or not isinstance(children, (list, tuple)):
+        raise ValueError("Invalid element record")
+
+    if attributes is not None:
+        if not isinstance(attributes, dict):
+            raise ValueError("Invalid element attributes")
+
+        for k, v in attributes.items():
+            if not _isString(k) or not _isString(v):
+                raise ValueError("Invalid element attributes")
+
+    return (name, attributes, chars, tuple([checkRecords(child) for child in children]))
+
+
+def _cacheFile(cache_dir, key):
+    return os.path.join(cache_dir, key + CACHE_EXT)
+
+
+def _remember(key, records):
+    if MEMORY_SIZE <= 0:
+        return
+
+    _memory[key] = records
+    _memory.move_to_end(key)
+
+    while len(_memory) > MEMORY_SIZE:
+        _memory.popitem(last=False)
+
+
+def load(cache_dir, key, check=checkRecords):
+    """
+    Return the records stored for the given key, or None if there are none.
+    'cache_dir' may be empty, if only the memory cache is used.
+    'check' is called with the data read from a cache file, and returns the
+    records (or raises ValueError if the data does not have the expected shape).
+    """
+
+    if key in _memory:
+        _memory.move_to_end(key)
+        debug.info("Loaded from memory cache:", key)
+        return _memory[key]
+
+    if not cache_dir:
+        return None
+
+    fname = _cacheFile(cache_dir, key)
+
+    if not os.path.exists(fname):
+        return None
+
+    try:
+        with io.open(fname, 'r', encoding='utf-8') as f:
+            records = check(json.load(f))
+
+        # Mark as recently used
+        os.utime(fname, None)
+    except Exception as e:
+        debug.warning("Could not read netlist cache '{f}': {e}".format(f=fname, e=e))
+        return None
+
+    debug.info("Loaded from cache:", fname)
+
+    _remember(key, records)
+
+    return records
+
+
+def store(cache_dir, key, records, max_size):
+    """
+    Store the records for the given key, then remove old entries
+    so that the cache is no larger than max_size (bytes).
+    'cache_dir' may be empty, if only the memory cache is used.
+    """
+
+    _remember(key, records)
+
+    if not cache_dir:
+        return True
+
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        # Write to a temporary file first, so other processes never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+
+        try:
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                # (dumps uses the C encoder, which dump does not)
+                f.write(json.dumps(records, ensure_ascii=False, separators=(',', ':')))
+
+            os.replace(tmp, _cacheFile(cache_dir, key))
+        except:
+            os.remove(tmp)
+            raise
+
+    except Exception as e:
+        debug.warning("Could not write netlist cache in '{d}': {e}".format(d=cache_dir, e=e))
+        return False
+
+    evict(cache_dir, max_size, keep=key)
+
+    return True
+
+
+def evict(cache_dir, max_size, keep=None):
+    """
+    Remove the least recently used entries, until the cache is no larger than max_size (bytes).
+    The entry for 'keep' is never removed.
+    """
+
+    entries = []
+
+    for fname in os.listdir(cache_dir):
+        if not fname.endswith(CACHE_EXT):
+            continue
+
+        path = os.path.join(cache_dir, fname)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum([e[1] for e in entries])
+
+    # Oldest first
+    for mtime, size, path in sorted(entries):
+        if total <= max_size:
+            break
+
+        if keep is not None and path == _cacheFile(cache_dir, keep):
+            continue
+
+        try:
+            os.remove(path)
+            total -= size
+            debug.info("Removed from netlist cache:", path)
+        except OSError:
+            pass
@@ -12,23 +12,48 @@ from __future__ import print_function
 import sys
 import os.path
 import xml.sax as sax
+from xml.parsers import expat
+from types import MappingProxyType
 
-from .component import Component, ComponentGroup
+from .component import Component, DNF
 from .preferences import BomPref
+from . import grouping
+from . import incremental as incremental_groups
+from . import netlist_cache
 from . import debug
+from . import timings
+
+# Separates the variant name from the field name, in variant fields e.g. "V2:Value"
+VARIANT_FIELD_SEPARATOR = ':'
+
+# Shared (read-only) attributes and children of elements which have none
+NO_ATTRIBUTES = MappingProxyType({})
+NO_CHILDREN = ()
 
 
 class xmlElement():
     """xml element which can represent all nodes of the netlist tree.  It can be
     used to easily generate various output formats by propogating format
     requests to children recursively.
+
+    Lookups by element name are served from indexes which are built the first
+    time they are required, and discarded whenever the tree below is modified.
     """
+
+    # Netlists can contain a very large number of elements
+    __slots__ = ("name", "attributes", "parent", "chars", "children", "_childIndex", "_index", "_attrIndex")
+
     def __init__(self, name, parent=None):
         self.name = name
-        self.attributes = {}
+        self.attributes = NO_ATTRIBUTES
         self.parent = parent
         self.chars = ""
-        self.children = []
+        self.children = NO_CHILDREN
+
+        # Lazily built lookup indexes (see _invalidate)
+        self._childIndex = None
+        self._index = None
+        self._attrIndex = None
 
     def __str__(self):
         """String representation of this netlist element
@@ -36,16 +61,96 @@ class xmlElement():
         """
         return self.name + "[" + self.chars + "]" + " attr_count:" + str(len(self.attributes))
 
+    def _invalidate(self):
+        """Discard the lookup indexes of this element and all of its parents"""
+        element = self
+        while element is not None:
+            element._childIndex = None
+            element._index = None
+            element._attrIndex = None
+            element = element.parent
+
+    def _getChildIndex(self):
+        """Return a dict of the direct children of this element, by name"""
+        if self._childIndex is None:
+            index = {}
+            for child in self.children:
+                index.setdefault(child.name, []).append(child)
+            self._childIndex = index
+
+        return self._childIndex
+
+    def _getIndex(self):
+        """Return a dict of all elements below this element, by name.
+        Each list is in document order (depth-first)
+        """
+        if self._index is None:
+            index = {}
+            stack = list(reversed(self.children))
+            while stack:
+                element = stack.pop()
+                index.setdefault(element.name, []).append(element)
+                stack.extend(reversed(element.children))
+            self._index = index
+
+        return self._index
+
+    def _getAttrIndex(self, elemName, attribute):
+        """Return a dict of all elements named 'elemName' below this element,
+        by the value of the given attribute. e.g. field name -> [<field>]
+        """
+        if self._attrIndex is None:
+            self._attrIndex = {}
+
+        key = (elemName, attribute)
+
+        if key not in self._attrIndex:
+            index = {}
+            for element in self._getIndex().get(elemName, []):
+                # Elements without the attribute are listed under None
+                index.setdefault(element.attributes.get(attribute), []).append(element)
+            self._attrIndex[key] = index
+
+        return self._attrIndex[key]
+
+    def _isWithin(self, element, top):
+        """Test if this element is a descendant of 'element' (searching no higher than 'top')"""
+        parent = self.parent
+        while parent is not None and parent is not top:
+            if parent is element:
+                return True
+            parent = parent.parent
+        return False
+
+    def _search(self, elemName, attribute, attrmatch):
+        """Search the children for an element with a matching attribute, without using the indexes"""
+        for child in self.children:
+            if child.name == elemName and child.attributes[attribute] == attrmatch:
+                ret = child.chars
+            else:
+                ret = child._search(elemName, attribute, attrmatch)
+
+            if ret != "":
+                return ret
+
+        return ""
+
     def addAttribute(self, attr, value):
         """Add an attribute to this element"""
+        if self.attributes is NO_ATTRIBUTES:
+            self.attributes = {}
         self.attributes[attr] = value
+        self._invalidate()
 
     def setAttribute(self, attr, value):
         """Set an attributes value - in fact does the same thing as add
         attribute
 
         """
+        if self.attributes is NO_ATTRIBUTES:
+            self.attributes = {}
         self.attributes[attr] = value
+        self._invalidate()
 
     def setChars(self, chars):
         """Set the characters for this element"""
@@ -57,8 +162,11 @@ class xmlElement():
 
     def addChild(self, child):
         """Add a child element to this element"""
+        if self.children is NO_CHILDREN:
+            self.children = []
         self.children.append(child)
-        return self.children[len(self.children) - 1]
+        self._invalidate()
+        return child
 
     def getParent(self):
         """Get the parent of this element (Could be None)"""
@@ -69,24 +177,21 @@ class xmlElement():
 
         Keywords:
         name -- The name of the child element to return"""
-        for child in self.children:
-            if child.name == name:
-                return child
+        children = self._getChildIndex().get(name)
+        if children:
+            return children[0]
         return None
 
     def getChildren(self, name=None):
         if name:
             # return _all_ children named "name"
-            ret = []
-            for child in self.children:
-                if child.name == name:
-                    ret.append(child)
-            return ret
+            return list(self._getChildIndex().get(name, []))
         else:
             return self.children
 
     def get(self, elemName, attribute="", attrmatch=""):
-        """Return the text data for either an attribute or an xmlElement
+        """Return the text data for either an attribute or an xmlElement.
+        The first matching element (depth-first) with a non-empty result is used
         """
         if (self.name == elemName):
             if attribute != "":
@@ -101,11 +206,39 @@ class xmlElement():
             else:
                 return self.chars
 
-        for child in self.children:
-            ret = child.get(elemName, attribute, attrmatch)
+        if not self.children:
+            return ""
+
+        if attribute != "" and attrmatch != "":
+            index = self._getAttrIndex(elemName, attribute)
+
+            if None in index:
+                # An element without the attribute is an error (if it is reached first)
+                return self._search(elemName, attribute, attrmatch)
+
+            # Every indexed element has a matching attribute
+            candidates = index.get(attrmatch, ())
+            attribute = ""
+        else:
+            candidates = self._getIndex().get(elemName, ())
+
+        # An element which matches (but is empty) hides any matches nested within it
+        hidden = None
+
+        for element in candidates:
+            if hidden is not None and element._isWithin(hidden, self):
+                continue
+
+            if attribute != "":
+                ret = element.attributes[attribute]
+            else:
+                ret = element.chars
+
             if ret != "":
                 return ret
 
+            hidden = element
+
         return ""
 
 
@@ -115,6 +248,9 @@ class libpart():
     This part class is implemented by wrapping an xmlElement with accessors.
     This xmlElement instance is held in field 'element'.
     """
+
+    __slots__ = ("element",)
+
     def __init__(self, xml_element):
         #
         self.element = xml_element
@@ -179,11 +315,20 @@ class netlist():
     scripts
 
     """
-    def __init__(self, fname="", prefs=None):
+
+    # Top-level sections which are not required to generate a BoM
+    SKIP_ELEMENTS = ["nets", "libraries"]
+
+    # Elements which are added to the component, library part (etc) lists (see _addToLists)
+    LIST_ELEMENTS = frozenset(["comp", "design", "libpart", "net", "library"])
+
+    def __init__(self, fname="", prefs=None, skipNets=False):
         """Initialiser for the genericNetlist class
 
         Keywords:
         fname -- The name of the generic netlist file to open (Optional)
+        skipNets -- Stream past the <nets> and <libraries> sections without
+                    building any elements for them (Optional)
 
         """
         self.design = None
@@ -195,8 +340,13 @@ class netlist():
         # The entire tree is loaded into self.tree
         self.tree = []
 
+        # Variant fields of each component (see getVariantFields)
+        self._variantFields = None
+
         self._curr_element = None
 
+        self.skipNets = skipNets
+
         if not prefs:
             prefs = BomPref()  # Default values
 
@@ -218,54 +368,60 @@ class netlist():
             self._curr_element = self._curr_element.addChild(
                 xmlElement(name, self._curr_element))
 
+        self._addToLists(self._curr_element)
+
+        return self._curr_element
+
+    def _addToLists(self, element):
+        """Add a new element to the component, library part (etc) lists"""
+
         # If this element is a component, add it to the components list
-        if self._curr_element.name == "comp":
-            self.components.append(Component(self._curr_element, prefs=self.prefs))
+        if element.name == "comp":
+            self.components.append(Component(element, prefs=self.prefs))
 
         # Assign the design element
-        if self._curr_element.name == "design":
-            self.design = self._curr_element
+        elif element.name == "design":
+            self.design = element
 
         # If this element is a library part, add it to the parts list
-        if self._curr_element.name == "libpart":
-            self.libparts.append(libpart(self._curr_element))
+        elif element.name == "libpart":
+            self.libparts.append(libpart(element))
 
         # If this element is a net, add it to the nets list
-        if self._curr_element.name == "net":
-            self.nets.append(self._curr_element)
+        elif element.name == "net":
+            self.nets.append(element)
 
         # If this element is a library, add it to the libraries list
-        if self._curr_element.name == "library":
-            self.libraries.append(self._curr_element)
-
-        return self._curr_element
+        elif element.name == "library":
+            self.libraries.append(element)
 
     def endDocument(self):
         """Called when the netlist document has been fully parsed"""
         # When the document is complete, the library parts must be linked to
         # the components as they are seperate in the tree so as not to
         # duplicate library part information for every component
+
+        # Lookup of library parts by (lib, part), including any part aliases.
+        # Where multiple parts match, the first in the netlist takes priority
+        parts = {}
+
+        for p in self.libparts:
+            lib = p.getLibName()
+
+            parts.setdefault((lib, p.getPartName()), p)
+
+            for alias in p.getAliases() or []:
+                parts.setdefault((lib, alias), p)
+
         for c in self.components:
-            for p in self.libparts:
-                if p.getLibName() == c.getLibName():
-                    if p.getPartName() == c.getPartName():
-                        c.setLibPart(p)
-                        break
-                    else:
-                        aliases = p.getAliases()
-                        if aliases and self.aliasMatch(c.getPartName(), aliases):
-                            c.setLibPart(p)
-                            break
+            p = parts.get((c.getLibName(), c.getPartName()))
+
+            if p is not None:
+                c.setLibPart(p)
 
             if not c.getLibPart():
                 debug.warning('missing libpart for ref:', c.getRef(), c.getPartName(), c.getLibName())
 
-    def aliasMatch(self, partName, aliasList):
-        for alias in aliasList:
-            if partName == alias:
-                return True
-        return False
-
     def endElement(self):
         """End the current element and switch to its parent"""
         self._curr_element = self._curr_element.getParent()
@@ -324,44 +480,140 @@ class netlist():
 
         return ret
 
-    def groupComponents(self, components):
+    def getVariantFields(self):
+        """Return a list of (component, [(variant, field, target field)]) for
+        each of the interesting components. Every field may name a variant,
+        e.g. field "V2:Value" sets "Value" for variant "v2", and field "V2"
+        (with a DNF value) removes the component from variant "v2".
 
-        groups = []
+        The field names are only split once, however many variants are used
+        """
 
-        # Iterate through each component, and test whether a group for these already exists
-        for c in components:
+        if self._variantFields is None:
+            self._variantFields = []
 
-            if self.prefs.useRegex:
-                # Skip components if they do not meet regex requirements
-                if not c.testRegInclude():
-                    continue
-                if c.testRegExclude():
+            for component in self.getInterestingComponents():
+                fields = []
+
+                for field in component.getFieldNames():
+                    try:
+                        # Find fields used for variant
+                        [variant_name, field_name] = field.split(VARIANT_FIELD_SEPARATOR)
+                    except ValueError:
+                        [variant_name, field_name] = [field, '']
+
+                    fields.append((variant_name.lower(), field, field_name))
+
+                self._variantFields.append((component, fields))
+
+        return self._variantFields
+
+    def getVariantComponents(self, pcbConfig):
+        """Return the interesting components, with the variant fields for the
+        given variant(s) applied (complex variant processing).
+
+        Variant fields are applied to a view of each component (see
+        Component.overlayField), so the netlist itself is not modified.
+        Components which are not populated in the variant are removed.
+        """
+
+        pcbConfig = set(pcbConfig)
+
+        components = []
+
+        do_not_populate = set()
+
+        for component, fields in self.getVariantFields():
+            view = None
+
+            for variant_name, field, field_name in fields:
+                if variant_name not in pcbConfig:
                     continue
 
-            found = False
+                # Variant exist for component
+                if view is None:
+                    view = component.view()
 
-            for g in groups:
-                if g.matchComponent(c):
-                    g.addComponent(c)
-                    found = True
+                variant_field_value = view.getField(field)
+
+                # Process no loaded option
+                if variant_field_value.lower() in DNF and not field_name:
+                    do_not_populate.add(component.getRef())
                     break
 
-            if not found:
-                g = ComponentGroup(prefs=self.prefs)  # Pass down the preferences
-                g.addComponent(c)
-                groups.append(g)
+                # Write variant value to target field
+                view.overlayField(field_name, variant_field_value)
 
-        # Sort the references within each group
-        for g in groups:
-            g.sortComponents()
-            g.updateFields(self.prefs.useAlt)
+            components.append(component if view is None else view)
 
-        # Sort the groups
-        # First priority is the Type of component (e.g. R?, U?, L?)
-        groups = sorted(groups, key=lambda g: [g.components[0].getPrefix(), g.components[0].getValueSort()])
+        # Remove any components (by reference) which are not populated
+        if do_not_populate:
+            components = [c for c in components if c.getRef() not in do_not_populate]
+
+        return components
+
+    def filterComponents(self, components):
+        """Return the components which meet the regex requirements (if enabled)"""
+
+        if self.prefs.useRegex:
+            # Skip components if they do not meet regex requirements
+            components = [c for c in components if c.testRegInclude() and not c.testRegExclude()]
+
+        return components
+
+    def sortGroups(self, groups):
+        """Return the groups in BoM order (see BomPref.sortOrder)"""
+
+        # By default, first priority is the Type of component (e.g. R?, U?, L?), then the value
+        order = [(name.lstrip("-"), name.startswith("-")) for name in self.prefs.sortOrder]
+
+        if not any([reverse for name, reverse in order]):
+            names = [name for name, reverse in order]
+            return sorted(groups, key=lambda g: [g.components[0].getSortKey(name) for name in names])
+
+        # Sort by the least significant key first (the sort is stable)
+        groups = list(groups)
+
+        for name, reverse in reversed(order):
+            groups.sort(key=lambda g: g.components[0].getSortKey(name), reverse=reverse)
 
         return groups
 
+    def groupComponents(self, components, incremental=False):
+        """Sort the components into groups, returning the groups in BoM order.
+        If 'incremental' is set, the groups from the previous run are reused
+        where possible (see incremental.py)
+        """
+
+        with timings.stage("filter"):
+            components = self.filterComponents(components)
+
+        if incremental and self.prefs.cacheDir:
+            with timings.stage("group (incremental)"):
+                previous = incremental_groups.loadState(self, self.prefs)
+                groups, state = incremental_groups.groupComponents(components, self.prefs, previous)
+                incremental_groups.saveState(self, self.prefs, state)
+
+            with timings.stage("sortGroups"):
+                return self.sortGroups(groups)
+
+        # Sort the components into groups (see grouping.py)
+        with timings.stage("group"):
+            groups = grouping.groupComponents(components, self.prefs)
+
+        # Sort the references within each group
+        with timings.stage("sortComponents"):
+            for g in groups:
+                g.sortComponents()
+
+        with timings.stage("updateFields"):
+            for g in groups:
+                g.updateFields(self.prefs.useAlt)
+
+        # Sort the groups
+        with timings.stage("sortGroups"):
+            return self.sortGroups(groups)
+
     def load(self, fname):
         """Load a KiCad generic netlist
 
@@ -369,14 +621,148 @@ class netlist():
         fname -- The name of the generic netlist file to open
 
         """
+        # Try the netlist cache first (if enabled)
+        cache_dir = self.prefs.cacheDir
+        cache_key = None
+
+        if cache_dir or netlist_cache.MEMORY_SIZE:
+            try:
+                cache_key = netlist_cache.cacheKey(fname, self.skipNets)
+            except IOError:
+                cache_key = None
+
+            if cache_key is not None:
+                records = netlist_cache.load(cache_dir, cache_key)
+
+                if records is not None:
+                    self.loadRecords(records)
+                    return
+
         try:
-            self._reader = sax.make_parser()
-            self._reader.setContentHandler(_gNetReader(self))
-            self._reader.parse(fname)
+            if self.prefs.netlistParser == "sax":
+                self._parseSAX(fname)
+            else:
+                self._parseExpat(fname)
         except IOError as e:
             debug.error(__file__, ":", e)
             sys.exit(-1)
 
+        if cache_key is not None:
+            netlist_cache.store(cache_dir, cache_key, netlist_cache.treeRecords(self.tree), self.prefs.cacheSize * 1024 * 1024)
+
+    def _parseSAX(self, fname):
+        """Build the tree with xml.sax (see _gNetReader)"""
+        self._reader = sax.make_parser()
+        # Element and attribute names are repeated many times
+        self._reader.setFeature(sax.handler.feature_string_interning, True)
+        self._reader.setContentHandler(_gNetReader(self))
+        self._reader.parse(fname)
+
+    def _parseExpat(self, fname):
+        """Build the tree with xml.parsers.expat.
+
+        Builds the same tree as _parseSAX (see _gNetReader), but the expat
+        callbacks build the elements directly, rather than through a SAX
+        content handler and attribute objects. Skipped sections (see
+        skipNets) are passed over without building or checking anything.
+        """
+        parser = expat.ParserCreate()
+
+        skip = frozenset(self.SKIP_ELEMENTS if self.skipNets else ())
+        addToLists = self._addToLists
+        listed = self.LIST_ELEMENTS
+
+        # Current element, and depth within a skipped element
+        current = None
+        skipDepth = 0
+
+        def startElement(name, attrs):
+            nonlocal current, skipDepth
+
+            if name in skip:
+                skipDepth = 1
+                parser.StartElementHandler = startSkipped
+                parser.EndElementHandler = endSkipped
+                parser.CharacterDataHandler = None
+                return
+
+            element = xmlElement(name, current)
+
+            # expat creates a new dict of attributes for each element
+            if attrs:
+                element.attributes = attrs
+
+            if current is None:
+                self.tree = element
+            elif current.children is NO_CHILDREN:
+                current.children = [element]
+            else:
+                current.children.append(element)
+
+            current = element
+
+            if name in listed:
+                addToLists(element)
+
+        def endElement(name):
+            nonlocal current
+            current = current.parent
+
+        def characters(content):
+            # White space is ignored in the same way as _gNetReader.characters
+            if not content.isspace():
+                current.chars += content
+
+        def startSkipped(name, attrs):
+            nonlocal skipDepth
+            skipDepth += 1
+
+        def endSkipped(name):
+            nonlocal skipDepth
+            skipDepth -= 1
+
+            if skipDepth == 0:
+                parser.StartElementHandler = startElement
+                parser.EndElementHandler = endElement
+                parser.CharacterDataHandler = characters
+
+        parser.StartElementHandler = startElement
+        parser.EndElementHandler = endElement
+        parser.CharacterDataHandler = characters
+
+        with open(fname, 'rb') as f:
+            # Text is passed to characters() in pieces, split at the end of each block.
+            # Use the same block size as xml.sax, so the white space is ignored in the same way.
+            for block in iter(lambda: f.read(1 << 16), b''):
+                parser.Parse(block, False)
+
+            parser.Parse(b'', True)
+
+        self.endDocument()
+
+    def loadRecords(self, records):
+        """Build the tree from records stored in the netlist cache (see netlist_cache.py)"""
+        self.tree = self._addRecord(records, None)
+        self.endDocument()
+
+    def _addRecord(self, record, parent):
+        name, attributes, chars, children = record
+
+        element = xmlElement(name, parent)
+
+        # Copied, as the records may be kept in memory (see netlist_cache.MEMORY_SIZE)
+        if attributes:
+            element.attributes = dict(attributes)
+
+        element.chars = chars
+
+        self._addToLists(element)
+
+        if children:
+            element.children = [self._addRecord(child, element) for child in children]
+
+        return element
+
 
 class _gNetReader(sax.handler.ContentHandler):
     """SAX KiCad generic netlist content handler - passes most of the work back
@@ -386,17 +772,41 @@ class _gNetReader(sax.handler.ContentHandler):
     def __init__(self, aParent):
         self.parent = aParent
 
+        # Names of elements to skip (along with all of their children)
+        if aParent.skipNets:
+            self.skip = aParent.SKIP_ELEMENTS
+        else:
+            self.skip = []
+
+        # Depth within a skipped element (zero when not skipping)
+        self.skipDepth = 0
+
     def startElement(self, name, attrs):
         """Start of a new XML element event"""
+        if self.skipDepth > 0:
+            self.skipDepth += 1
+            return
+
+        if name in self.skip:
+            self.skipDepth = 1
+            return
+
         element = self.parent.addElement(name)
 
         for name in attrs.getNames():
             element.addAttribute(name, attrs.getValue(name))
 
     def endElement(self, name):
+        if self.skipDepth > 0:
+            self.skipDepth -= 1
+            return
+
         self.parent.endElement()
 
     def characters(self, content):
+        if self.skipDepth > 0:
+            return
+
         # Ignore erroneous white space - ignoreableWhitespace does not get rid
         # of the need for this!
         if not content.isspace():
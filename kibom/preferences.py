@@ -7,6 +7,7 @@ import os
 
 from .columns import ColumnList
 from . import debug
+from . import units
 
 # Check python version to determine which version of ConfirParser to import
 if sys.version_info.major >= 3:
@@ -15,6 +16,79 @@ else:
     import ConfigParser
 
 
+class RegexFilter:
+    """
+    A list of [field, regex] rules, compiled once.
+    A component matches the filter if any regex matches the value of its field.
+    The rules for each field are combined into a single regex, so that each
+    field is only looked up (and searched) once per component.
+    """
+
+    def __init__(self, rules):
+
+        # List of (field, regex, compiled regex) in the original order
+        self.rules = []
+
+        # List of (field, compiled regex) for each field
+        self.fields = []
+
+        fields = {}
+
+        for rule in rules:
+            if type(rule) is not list or len(rule) != 2:
+                continue
+
+            field_name, regex = rule
+
+            try:
+                compiled = re.compile(regex, flags=re.IGNORECASE)
+            except re.error as e:
+                debug.error("Invalid regex '{reg}' for field '{field}': {e}".format(reg=regex, field=field_name, e=e))
+                continue
+
+            self.rules.append((field_name, regex, compiled))
+
+            fields.setdefault(field_name.lower(), []).append((field_name, regex, compiled))
+
+        for field_rules in fields.values():
+            field_name = field_rules[0][0]
+
+            # Expressions with groups cannot be combined (group numbers would change)
+            simple = [r for r in field_rules if r[2].groups == 0]
+            other = [r for r in field_rules if r[2].groups > 0]
+
+            if len(simple) > 1:
+                try:
+                    combined = "|".join(["(?:{r})".format(r=r[1]) for r in simple])
+                    self.fields.append((field_name, re.compile(combined, flags=re.IGNORECASE)))
+                    simple = []
+                except re.error:
+                    pass
+
+            for r in simple + other:
+                self.fields.append((field_name, r[2]))
+
+    def match(self, component):
+        """
+        Test the filter against a component.
+        Returns the first matching rule as (field, regex, field value), or None
+        """
+
+        for field_name, compiled in self.fields:
+            if compiled.search(component.getField(field_name)) is not None:
+                break
+        else:
+            return None
+
+        # Report the first rule (in the original order) which matches
+        for field_name, regex, compiled in self.rules:
+            field_value = component.getField(field_name)
+            if compiled.search(field_value) is not None:
+                return (field_name, regex, field_value)
+
+        return None
+
+
 class BomPref:
 
     SECTION_IGNORE = "IGNORE_COLUMNS"
@@ -49,6 +123,60 @@ class BomPref:
     OPT_HIDE_PCB_INFO = "hide_pcb_info"
     OPT_REF_SEPARATOR = "ref_separator"
     OPT_DATASHEET_AS_LINK = "datasheet_as_link"
+    OPT_CACHE_DIR = "netlist_cache_dir"
+    OPT_CACHE_SIZE = "netlist_cache_size"
+    OPT_NETLIST_PARSER = "netlist_parser"
+    OPT_VALUE_CACHE_SIZE = "value_cache_size"
+    OPT_SORT_ORDER = "sort_order"
+
+    # Netlist parsers (see netlist.load)
+    NETLIST_PARSERS = ["expat", "sax"]
+
+    # Settings which affect the component groups, or their fields (see groupingSettings)
+    GROUPING_PREFS = [
+        "aliases",
+        "boards",
+        "complexVariant",
+        "configField",
+        "groupConnectors",
+        "groups",
+        "mergeBlankFields",
+        "pcbConfig",
+        "refSeparator",
+        "useAlt",
+    ]
+
+    # Settings which do not (component filters, output, caches and internal state)
+    OTHER_PREFS = [
+        "_pcbConfigSet",
+        "_regexFilters",
+        "as_link",
+        "backup",
+        "cacheDir",
+        "cacheSize",
+        "colRename",
+        "corder",
+        "digikey_link",
+        "generateDNF",
+        "hideHeaders",
+        "hidePcbInfo",
+        "ignore",
+        "ignoreDNF",
+        "join",
+        "lcsc_link",
+        "mouser_link",
+        "netlistParser",
+        "numberRows",
+        "outputFileName",
+        "parser",
+        "regExcludes",
+        "regIncludes",
+        "separatorCSV",
+        "sortOrder",
+        "useRegex",
+        "valueCacheSize",
+        "variantFileNameFormat",
+    ]
 
     def __init__(self):
         # List of headings to ignore in BoM generation
@@ -77,10 +205,16 @@ class BomPref:
         self.pcbConfig = ["default"]
         self.complexVariant = False  # To enable complex variant processing
         self.refSeparator = " "
+        self.sortOrder = ["prefix", "value"]  # Sort keys for the BoM rows (see Component.getSortKey)
 
         self.backup = "%O.tmp"
         self.as_link = False
 
+        self.cacheDir = ""  # Directory for the parsed netlist cache (disabled by default)
+        self.cacheSize = 50  # Maximum size of the netlist cache (MB)
+        self.netlistParser = "expat"  # Parser used to read the netlist (expat is faster, sax is the original parser)
+        self.valueCacheSize = units.CACHE_SIZE  # Number of parsed component values to remember (see units.setCacheSize)
+
         self.separatorCSV = None
         self.outputFileName = "%O_bom_%v%V"
         self.variantFileNameFormat = "_(%V)"
@@ -123,6 +257,43 @@ class BomPref:
         # Nothing to join by default (#81)
         self.join = []
 
+        # Compiled regex filters (see getRegexFilter)
+        self._regexFilters = {}
+
+        # pcbConfig as a set (see getPcbConfig)
+        self._pcbConfigSet = None
+
+    def _getRegexFilter(self, name, rules):
+        # Compile the rules, unless they have already been compiled
+        if name in self._regexFilters:
+            compiled_rules, regex_filter = self._regexFilters[name]
+            if compiled_rules == rules:
+                return regex_filter
+
+        regex_filter = RegexFilter(rules)
+        self._regexFilters[name] = ([list(r) for r in rules], regex_filter)
+
+        return regex_filter
+
+    def getPcbConfig(self):
+        """Return the current variant(s) (pcbConfig) as a frozenset, for evaluating fit rules"""
+        if self._pcbConfigSet is None or self._pcbConfigSet[0] != self.pcbConfig:
+            self._pcbConfigSet = (list(self.pcbConfig), frozenset(self.pcbConfig))
+
+        return self._pcbConfigSet[1]
+
+    def groupingSettings(self):
+        """Return the (name, value) of each setting which affects the component groups (see incremental.stateKey)"""
+        return [(name, getattr(self, name)) for name in self.GROUPING_PREFS]
+
+    def getRegExcludeFilter(self):
+        """Return the compiled regExcludes (see RegexFilter)"""
+        return self._getRegexFilter(self.SECTION_REGEXCLUDES, self.regExcludes)
+
+    def getRegIncludeFilter(self):
+        """Return the compiled regIncludes (see RegexFilter)"""
+        return self._getRegexFilter(self.SECTION_REGINCLUDES, self.regIncludes)
+
     # Check an option within the SECTION_GENERAL group
     def checkOption(self, parser, opt, default=False):
         if parser.has_option(self.SECTION_GENERAL, opt):
@@ -195,6 +366,33 @@ class BomPref:
         else:
             self.as_link = False
 
+        if cf.has_option(self.SECTION_GENERAL, self.OPT_CACHE_DIR):
+            self.cacheDir = cf.get(self.SECTION_GENERAL, self.OPT_CACHE_DIR).strip()
+            # Relative to the config file
+            if self.cacheDir:
+                self.cacheDir = os.path.join(os.path.dirname(file), self.cacheDir)
+
+        if cf.has_option(self.SECTION_GENERAL, self.OPT_CACHE_SIZE):
+            self.cacheSize = self.checkInt(cf, self.OPT_CACHE_SIZE, default=self.cacheSize)
+
+        if cf.has_option(self.SECTION_GENERAL, self.OPT_VALUE_CACHE_SIZE):
+            self.valueCacheSize = self.checkInt(cf, self.OPT_VALUE_CACHE_SIZE, default=self.valueCacheSize)
+
+        if cf.has_option(self.SECTION_GENERAL, self.OPT_SORT_ORDER):
+            order = cf.get(self.SECTION_GENERAL, self.OPT_SORT_ORDER).lower().split(",")
+            order = [k.strip() for k in order if k.strip()]
+
+            if order:
+                self.sortOrder = order
+
+        if cf.has_option(self.SECTION_GENERAL, self.OPT_NETLIST_PARSER):
+            parser = cf.get(self.SECTION_GENERAL, self.OPT_NETLIST_PARSER).strip().lower()
+
+            if parser in self.NETLIST_PARSERS:
+                self.netlistParser = parser
+            else:
+                debug.warning("Unknown netlist parser '{p}' - using '{d}'".format(p=parser, d=self.netlistParser))
+
         if cf.has_option(self.SECTION_GENERAL, self.OPT_HIDE_HEADERS):
             self.hideHeaders = cf.get(self.SECTION_GENERAL, self.OPT_HIDE_HEADERS) == '1'
 
@@ -248,6 +446,10 @@ class BomPref:
                 if len(re.split('[ \t]+', pair)) == 2:
                     self.regIncludes.append(re.split('[ \t]+', pair))
 
+        # Compile the regex rules now, so that any errors are reported once
+        self.getRegExcludeFilter()
+        self.getRegIncludeFilter()
+
         if self.SECTION_COLUMN_RENAME in cf.sections():
             self.colRename = {}
             for pair in cf.options(self.SECTION_COLUMN_RENAME):
@@ -295,12 +497,28 @@ class BomPref:
         cf.set(self.SECTION_GENERAL, '; Character used to separate reference designators in output')
         cf.set(self.SECTION_GENERAL, self.OPT_REF_SEPARATOR, "'" + self.refSeparator + "'")
 
+        cf.set(self.SECTION_GENERAL, '; Order of the BoM rows: comma separated sort keys, most significant first')
+        cf.set(self.SECTION_GENERAL, '; prefix (reference prefix), value (by magnitude for R, L and C), reference, or a field name. Use a - prefix (e.g. -value) to reverse')
+        cf.set(self.SECTION_GENERAL, self.OPT_SORT_ORDER, ", ".join(self.sortOrder))
+
         cf.set(self.SECTION_GENERAL, '; Make a backup of the bom before generating the new one, using the following template')
         cf.set(self.SECTION_GENERAL, self.OPT_BACKUP, self.backup)
 
         cf.set(self.SECTION_GENERAL, '; Put the datasheet as a link for the following field')
         cf.set(self.SECTION_GENERAL, self.OPT_DATASHEET_AS_LINK, self.as_link)
 
+        cf.set(self.SECTION_GENERAL, '; Directory (relative to this file) used to cache parsed netlists, e.g. .kibom_cache. Leave blank to disable the cache')
+        cf.set(self.SECTION_GENERAL, self.OPT_CACHE_DIR, self.cacheDir)
+
+        cf.set(self.SECTION_GENERAL, '; Maximum size of the netlist cache (MB). The least recently used netlists are removed first')
+        cf.set(self.SECTION_GENERAL, self.OPT_CACHE_SIZE, self.cacheSize)
+
+        cf.set(self.SECTION_GENERAL, '; Parser used to read the netlist: expat (fastest) or sax')
+        cf.set(self.SECTION_GENERAL, self.OPT_NETLIST_PARSER, self.netlistParser)
+
+        cf.set(self.SECTION_GENERAL, '; Number of parsed component values to remember (0 to disable)')
+        cf.set(self.SECTION_GENERAL, self.OPT_VALUE_CACHE_SIZE, self.valueCacheSize)
+
         cf.set(self.SECTION_GENERAL, '; Default number of boards to produce if none given on CLI with -n')
         cf.set(self.SECTION_GENERAL, self.OPT_DEFAULT_BOARDS, self.boards)
 
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+BoM server (see --server), for generating many BoMs from one process.
+
+Each job is a JSON object on a single line:
+
+    {"args": ["netlist.xml", "bom.csv", "-r", "A"], "cwd": "/path/to/project"}
+
+where "args" are the same command line arguments as for KiBOM_CLI.py. The
+response is a JSON object on a single line:
+
+    {"status": 0, "output": "..."}
+
+with the exit status and the (console) output of the job. The commands
+{"command": "ping"} and {"command": "shutdown"} are also accepted.
+
+Jobs are read from a Unix socket (see client.py) or from stdin. The
+modules, the preferences (bom.ini files) and the parsed netlists are kept
+in memory between jobs, so a job does not pay for starting Python, importing
+KiBoM or parsing an unchanged netlist.
+"""
+
+from __future__ import print_function
+
+import copy
+import io
+import json
+import os
+import socketserver
+import stat
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+from .preferences import BomPref
+from .version import KIBOM_VERSION
+from . import debug
+from . import netlist_cache
+
+# Number of parsed netlists kept in memory
+MEMORY_SIZE = 16
+
+
+class BomServer(object):
+    """
+    Runs BoM jobs, keeping the preferences and parsed netlists in memory.
+    'run' is called as run(args, server) for each job, and returns the exit status.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.running = False
+
+        # (config file, no_colon_sep) -> (file stat, preferences)
+        self.preferences = {}
+
+    def readPreferences(self, config_file, no_colon_sep=False):
+        """
+        Return the preferences read from a config file (a copy, which the job can modify)
+        """
+
+        config_file = os.path.abspath(config_file)
+        stat = os.stat(config_file)
+        stat = (stat.st_mtime_ns, stat.st_size)
+
+        key = (config_file, no_colon_sep)
+
+        if key in self.preferences and self.preferences[key][0] == stat:
+            debug.info("Preferences loaded from memory:", config_file)
+        else:
+            pref = BomPref()
+            pref.Read(config_file, no_colon_sep=no_colon_sep)
+            self.preferences[key] = (stat, pref)
+
+        return copy.deepcopy(self.preferences[key][1])
+
+    def handle(self, request):
+        """
+        Handle a request, returning the response
+        """
+
+        if not isinstance(request, dict):
+            return {"status": 1, "output": "Invalid request\n"}
+
+        command = request.get("command", "run")
+
+        if command == "ping":
+            return {"status": 0, "output": "KiBOM version {v}\n".format(v=KIBOM_VERSION)}
+
+        if command == "shutdown":
+            self.running = False
+            return {"status": 0, "output": ""}
+
+        if command != "run":
+            return {"status": 1, "output": "Unknown command '{c}'\n".format(c=command)}
+
+        output = io.StringIO()
+
+        cwd = os.getcwd()
+
+        debug.resetErrorCount()
+
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                os.chdir(request.get("cwd", cwd))
+                status = self.run(list(request.get("args", [])), self)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                output.write("{c}\n".format(c=e.code))
+                status = 1
+        except Exception:
+            output.write(traceback.format_exc())
+            status = 1
+        finally:
+            os.chdir(cwd)
+
+        return {"status": status, "output": output.getvalue()}
+
+    def serveStream(self, rfile, wfile):
+        """
+        Handle requests (JSON lines) from rfile, writing the responses to wfile
+        """
+
+        for line in rfile:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"status": 1, "output": "Invalid request: {e}\n".format(e=e)}
+            else:
+                response = self.handle(request)
+
+            data = json.dumps(response) + "\n"
+
+            if isinstance(wfile, io.TextIOBase):
+                wfile.write(data)
+            else:
+                wfile.write(data.encode('utf-8'))
+
+            wfile.flush()
+
+            if not self.running:
+                break
+
+    def serve(self, address):
+        """
+        Serve requests from a Unix socket, or from stdin if address is "-".
+        Returns the exit status.
+        """
+
+        netlist_cache.MEMORY_SIZE = MEMORY_SIZE
+
+        self.running = True
+
+        if address == "-":
+            self.serveStream(sys.stdin, sys.stdout)
+            return 0
+
+        bom_server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                bom_server.serveStream(self.rfile, self.wfile)
+
+        if os.path.exists(address):
+            # Only a (stale) socket is removed, never any other file
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                debug.error("'{a}' exists, and is not a socket".format(a=address))
+                return 1
+
+            os.remove(address)
+
+        server = socketserver.UnixStreamServer(address, Handler)
+
+        # To check that the socket is still ours when shutting down
+        created = os.stat(address)
+
+        debug.message("KiBOM server listening on '{a}'".format(a=address))
+
+        try:
+            while self.running:
+                server.handle_request()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+            try:
+                current = os.stat(address)
+
+                if (current.st_dev, current.st_ino) == (created.st_dev, created.st_ino):
+                    os.remove(address)
+            except OSError:
+                pass
+
+        return 0
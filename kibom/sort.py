@@ -2,10 +2,13 @@
 
 import re
 
+# Splits a string into text and numbers (see natural_sort)
+DIGITS = re.compile(r'(\d+)')
+
 
 def natural_sort(string):
     """
     Natural sorting function which sorts by numerical value of a string,
     rather than raw ASCII value.
     """
-    return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', string)]
+    return [int(s) if s.isdigit() else s for s in DIGITS.split(string)]
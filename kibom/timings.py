@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing of each stage of BoM generation (see --timings)
+
+Each stage records the wall time, the CPU time (of the thread which ran it)
+and the peak memory (resident set size) of the process when it finished.
+Nothing is recorded unless timings are enabled.
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from . import debug
+
+# CPU time of the current thread (if supported)
+_cpuTime = getattr(time, 'thread_time', time.process_time)
+
+ENABLED = False
+
+# Recorded stages, in the order in which they finished
+STAGES = []
+
+# Variant which the stages are recorded against
+VARIANT = None
+
+# Start of the run (wall time), as set by reset()
+_start = time.perf_counter()
+
+_lock = threading.Lock()
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    global VARIANT
+    global _start
+
+    with _lock:
+        del STAGES[:]
+
+    VARIANT = None
+    _start = time.perf_counter()
+
+
+def elapsed():
+    """
+    Return the wall time since the run started (stages may overlap, so this can be less than their sum)
+    """
+
+    return time.perf_counter() - _start
+
+
+def setVariant(variant):
+    global VARIANT
+    VARIANT = variant
+
+
+def peakMemory():
+    """
+    Return the peak memory (resident set size) of the process in bytes, or None if not available
+    """
+
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports in kilobytes, macOS in bytes
+    if sys.platform == 'darwin':
+        return rss
+
+    return rss * 1024
+
+
+@contextmanager
+def stage(name):
+    """
+    Record the time taken by a stage e.g.
+
+    with timings.stage("group"):
+        ...
+    """
+
+    if not ENABLED:
+        yield
+        return
+
+    variant = VARIANT
+
+    wall = time.perf_counter()
+    cpu = _cpuTime()
+
+    try:
+        yield
+    finally:
+        record = {
+            "variant": variant,
+            "stage": name,
+            "wall": time.perf_counter() - wall,
+            "cpu": _cpuTime() - cpu,
+            "peak_memory": peakMemory(),
+        }
+
+        with _lock:
+            STAGES.append(record)
+
+
+def summary():
+    """
+    Return a table of the recorded stages (as a string)
+    """
+
+    lines = []
+
+    lines.append("{v:<16}{s:<24}{w:>10}{c:>10}{m:>12}".format(v="Variant", s="Stage", w="Wall (s)", c="CPU (s)", m="Peak (MB)"))
+
+    wall = 0
+    cpu = 0
+
+    for record in STAGES:
+        peak = record["peak_memory"]
+
+        lines.append("{v:<16}{s:<24}{w:>10.3f}{c:>10.3f}{m:>12}".format(
+            v="-" if record["variant"] is None else record["variant"],
+            s=record["stage"],
+            w=record["wall"],
+            c=record["cpu"],
+            m="-" if peak is None else "{p:.1f}".format(p=peak / 1e6)))
+
+        wall += record["wall"]
+        cpu += record["cpu"]
+
+    lines.append("{v:<16}{s:<24}{w:>10.3f}{c:>10.3f}".format(v="", s="Sum of stages", w=wall, c=cpu))
+    lines.append("{v:<16}{s:<24}{w:>10.3f}".format(v="", s="Total", w=elapsed()))
+
+    return "\n".join(lines)
+
+
+def writeJSON(filename, **info):
+    """
+    Write the recorded stages to a JSON file (along with any extra info)
+    """
+
+    report = dict(info)
+    report["stages"] = list(STAGES)
+    report["wall"] = elapsed()
+
+    try:
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2)
+    except IOError as e:
+        debug.error("Could not write timings to '{f}': {e}".format(f=filename, e=e))
+        return False
+
+    debug.info("Timings -> {f}".format(f=filename))
+
+    return True
@@ -12,6 +12,7 @@ e.g.
 from __future__ import unicode_literals
 import re
 import locale
+import functools
 
 PREFIX_MICRO = [u"μ", u"µ", "u", "micro"]
 PREFIX_MILLI = ["milli", "m"]
@@ -37,6 +38,15 @@ match = None
 # Current locale decimal point value
 decimal_point = None
 
+# Maximum number of parsed values which are remembered (see setCacheSize)
+CACHE_SIZE = 4096
+
+# Cached version of parseValue()
+_cache = None
+
+# Size of _cache
+_cacheSize = None
+
 
 def getUnit(unit):
     """
@@ -96,11 +106,56 @@ def matchString():
     return r"^([0-9\.]+)\s*(" + groupString(PREFIX_ALL) + ")*(" + groupString(UNIT_ALL) + r")*(\d*)$"
 
 
+def setCacheSize(size):
+    """
+    Set the maximum number of parsed values to remember (0 disables the cache).
+    The cache is kept if the size has not changed.
+    """
+
+    global _cache, _cacheSize
+
+    if size == _cacheSize:
+        return
+
+    if size > 0:
+        _cache = functools.lru_cache(maxsize=size)(parseValue)
+    else:
+        _cache = None
+
+    _cacheSize = size
+
+
+def cacheInfo():
+    """
+    Return the (hits, misses) of the parsed value cache
+    """
+
+    if _cache is None:
+        return (0, 0)
+
+    info = _cache.cache_info()
+
+    return (info.hits, info.misses)
+
+
 def compMatch(component):
     """
     Return a normalized value and units for a given component value string
     e.g. compMatch('10R2') returns (10, R)
     e.g. compMatch('3.3mOhm') returns (0.0033, R)
+
+    Results are cached, as the same values are parsed many times
+    """
+
+    if _cache is None:
+        return parseValue(component)
+
+    return _cache(component)
+
+
+def parseValue(component):
+    """
+    Parse a component value string (see compMatch)
     """
 
     # Convert the decimal point from the current locale to a '.'
@@ -167,10 +222,10 @@ def componentValue(valString):
 
 
 def compareValues(c1, c2):
-    """ Compare two values """
+    """ Compare two values (either value strings, or values already parsed by compMatch) """
 
-    r1 = compMatch(c1)
-    r2 = compMatch(c2)
+    r1 = c1 if isinstance(c1, tuple) else compMatch(c1)
+    r2 = c2 if isinstance(c2, tuple) else compMatch(c2)
 
     if not r1 or not r2:
         return False
@@ -192,3 +247,6 @@ def compareValues(c1, c2):
             return True  # No units for component 2
 
     return False
+
+
+setCacheSize(CACHE_SIZE)
@@ -27,8 +27,8 @@ else:
 
         nGroups = len(groups)
         nTotal = sum([g.getCount() for g in groups])
-        nFitted = sum([g.getCount() for g in groups if g.isFitted()])
-        nBuild = nFitted * prefs.boards
+        nFitted = sum([g.getFittedCount() for g in groups])
+        nBuild = sum([g.getBuildCount() for g in groups])
 
         workbook = xlsxwriter.Workbook(filename)
         worksheet = workbook.add_worksheet()
@@ -10,8 +10,36 @@ prefs = BomPref object
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from xml.etree import ElementTree
-from xml.dom import minidom
+from xml.sax.saxutils import escape
+
+# Characters which must be escaped within an attribute value
+ATTR_ENTITIES = {
+    '"': "&quot;",
+    '\n': "&#10;",
+    '\r': "&#13;",
+    '\t': "&#9;",
+}
+
+
+def xmlAttributes(attrib):
+    """
+    Return a string of XML attributes e.g. ' a="1" b="2"'
+    """
+
+    return "".join([' {k}="{v}"'.format(k=k, v=escape(v, ATTR_ENTITIES)) for k, v in attrib.items()])
+
+
+def xmlName(heading):
+    """
+    Return a valid XML attribute name for a column heading
+    """
+
+    h = heading.replace(' ', '_')  # Replace spaces, xml no likey
+    h = h.replace('"', '')
+    h = h.replace("'", '')
+    h = h.replace(':', '_')  # e.g. variant fields "V2:Value"
+
+    return h
 
 
 def WriteXML(filename, groups, net, headings, head_names, prefs):
@@ -21,8 +49,8 @@ def WriteXML(filename, groups, net, headings, head_names, prefs):
 
     nGroups = len(groups)
     nTotal = sum([g.getCount() for g in groups])
-    nFitted = sum([g.getCount() for g in groups if g.isFitted()])
-    nBuild = nFitted * prefs.boards
+    nFitted = sum([g.getFittedCount() for g in groups])
+    nBuild = sum([g.getBuildCount() for g in groups])
 
     attrib = {}
 
@@ -39,30 +67,37 @@ def WriteXML(filename, groups, net, headings, head_names, prefs):
     attrib['Number_of_PCBs'] = str(prefs.boards)
     attrib['Total_Components'] = str(nBuild)
 
-    xml = ElementTree.Element('KiCad_BOM', attrib=attrib, encoding='utf-8')
+    attrib['encoding'] = 'utf-8'
 
-    for group in groups:
-        if prefs.ignoreDNF and not group.isFitted():
-            continue
+    names = [xmlName(h) for h in head_names]
 
-        row = group.getRow(headings)
+    # Each group is written straight to the file, rather than building the whole document first
+    with open(filename, "w", encoding="utf-8") as output:
+        output.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        output.write('<KiCad_BOM{a}'.format(a=xmlAttributes(attrib)))
 
-        attrib = {}
+        empty = True
 
-        for i, h in enumerate(head_names):
-            h = h.replace(' ', '_')  # Replace spaces, xml no likey
-            h = h.replace('"', '')
-            h = h.replace("'", '')
+        for group in groups:
+            if prefs.ignoreDNF and not group.isFitted():
+                continue
 
-            attrib[h] = str(row[i])
+            if empty:
+                output.write('>\n')
+                empty = False
 
-        ElementTree.SubElement(xml, "group", attrib=attrib)
+            row = group.getRow(headings)
 
-    with open(filename, "w", encoding="utf-8") as output:
-        out = ElementTree.tostring(xml, encoding="utf-8")
-        # There is probably a better way to write the data to file (without so many encoding/decoding steps),
-        # but toprettyxml() without specifying UTF-8 will chew up non-ASCII chars. Perhaps revisit if performance here
-        # is ever a concern
-        output.write(minidom.parseString(out).toprettyxml(indent="\t", encoding="utf-8").decode("utf-8"))
+            attrib = {}
+
+            for i, h in enumerate(names):
+                attrib[h] = str(row[i])
+
+            output.write('\t<group{a}/>\n'.format(a=xmlAttributes(attrib)))
+
+        if empty:
+            output.write('/>\n')
+        else:
+            output.write('</KiCad_BOM>\n')
 
     return True
@@ -16,6 +16,26 @@ coverage run -a -m kibom test/kibom-test.xml test/bom-out.xml
 
 # Generate an XLSX file
 coverage run -a -m kibom test/kibom-test.xml test/bom-out.xlsx
+# Generate multiple output files from a single run
+coverage run -a -m kibom test/kibom-test.xml test/bom-multi.csv -o bom-multi.html -o bom-multi.xml -o bom-multi.xlsx
+
+# Record the time taken by each stage
+coverage run -a -m kibom test/kibom-test.xml test/bom-timings.csv -o bom-timings.xlsx --timings --timings-json test/bom-timings.json --profile
+
+# Cache the parsed netlist (the second run reads the netlist from the cache)
+rm -rf test/bomcache
+coverage run -a -m kibom test/kibom-test.xml test/bom-cache.csv --cache-dir test/bomcache
+coverage run -a -m kibom test/kibom-test.xml test/bom-cache.csv --cache-dir test/bomcache
+
+# Reuse the groups from the previous run
+coverage run -a -m kibom test/kibom-test.xml test/bom-incremental.csv --cache-dir test/bomcache --incremental
+coverage run -a -m kibom test/kibom-test.xml test/bom-incremental.csv --cache-dir test/bomcache --incremental
+
+# Generate BOM files for several projects (the same netlist, by glob and by manifest)
+coverage run -a -m kibom --batch "test/kibom-test*.xml" -o bom-batch.csv -o bom-batch.html --jobs 2 --batch-report test/bom-batch.json
+printf "# Batch manifest\nkibom-test.xml\n" > test/bom-batch.tmp
+coverage run -a -m kibom --batch test/bom-batch.tmp -o bom-manifest.csv --jobs 1
+
 # Generate a BOM file in a subdirectory
 coverage run -a -m kibom test/kibom-test.xml bom-dir.csv -d bomsubdir -vvv
 coverage run -a -m kibom test/kibom-test.xml bom-dir2.html -d bomsubdir/secondsubdir -vvv
@@ -24,6 +44,27 @@ coverage run -a -m kibom test/kibom-test.xml bom-dir2.html -d bomsubdir/secondsu
 # Run the sanity checker on the output BOM files
 coverage run -a test/test_bom.py
 
+# Check the server and client
+coverage run -a test/test_server.py
+
+# Check that writers are only imported when required
+coverage run -a test/test_imports.py
+
+# Check the XML output
+coverage run -a test/test_xml.py
+
+# Check that the netlist parsers match
+coverage run -a test/test_parser.py
+
+# Check component grouping
+coverage run -a test/test_grouping.py
+
+# Check that the benchmarks run (with a small synthetic netlist)
+coverage run -a test/bench.py --sizes 100 --repeat 1
+
+# Check incremental grouping against a full run
+coverage run -a test/bench_incremental.py --sizes 500
+
 # Generate HTML code coverage output
 coverage html
 
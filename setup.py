@@ -18,9 +18,9 @@ setuptools.setup(
     url="https://github.com/SchrodingersGat/KiBom",
     license="MIT",
     packages=setuptools.find_packages(),
-    scripts=['KiBOM_CLI.py'],
+    scripts=['KiBOM_CLI.py', 'KiBOM_Client.py'],
     entry_points={
-        'console_scripts': ['kibom = kibom.__main__:main']
+        'console_scripts': ['kibom = kibom.__main__:main', 'kibom-client = kibom.client:main']
     },
     install_requires=[
         "xlsxwriter",
@@ -0,0 +1,212 @@
+"""
+Benchmark each phase of BoM generation, using synthetic netlists of several sizes.
+
+Each phase (parsing, libpart linking, filtering, grouping, sorting, updating
+the group fields and each of the writers) is timed separately. The fastest
+of several runs is recorded for each phase.
+
+Results can be saved as JSON (--output), and compared against an earlier
+set of results (--baseline). The exit status is 1 if any phase is slower
+than the baseline (by more than --threshold).
+
+Usage: python test/bench.py [--sizes 100,1000,10000] [--output results.json] [--baseline baseline.json]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.netlist_reader import netlist  # noqa: E402
+from kibom.preferences import BomPref  # noqa: E402
+from kibom.columns import ColumnList  # noqa: E402
+from kibom.bom_writer import WriteBoM  # noqa: E402
+from kibom.version import KIBOM_VERSION  # noqa: E402
+from kibom import grouping  # noqa: E402
+
+import netlist_gen  # noqa: E402
+
+SIZES = [100, 1000, 10000]
+
+WRITERS = ["csv", "html", "xml", "xlsx"]
+
+PHASES = ["parse", "link", "filter", "group", "sortComponents", "updateFields", "sortGroups"] + ["write_" + w for w in WRITERS]
+
+# Differences smaller than this (in seconds) are never reported as regressions
+MIN_DIFFERENCE = 0.001
+
+
+class _unlinkedNetlist(netlist):
+    """
+    A netlist which does not link the components to their library parts
+    when loaded, so that parsing and linking can be timed separately
+    """
+
+    def endDocument(self):
+        pass
+
+
+def runPhases(fname, output_dir):
+    """
+    Generate a BoM from the given netlist, returning the time taken for each phase
+    """
+
+    times = {}
+
+    prefs = BomPref()
+
+    def timed(phase, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        times[phase] = time.perf_counter() - start
+        return result
+
+    net = _unlinkedNetlist("", prefs)
+
+    timed("parse", net.load, fname)
+    timed("link", netlist.endDocument, net)
+
+    components = timed("filter", lambda: net.filterComponents(net.getInterestingComponents()))
+
+    groups = timed("group", grouping.groupComponents, components, prefs)
+
+    def sortComponents():
+        for g in groups:
+            g.sortComponents()
+
+    def updateFields():
+        for g in groups:
+            g.updateFields(prefs.useAlt)
+
+    timed("sortComponents", sortComponents)
+    timed("updateFields", updateFields)
+
+    groups = timed("sortGroups", net.sortGroups, groups)
+
+    columns = ColumnList(prefs.corder)
+
+    for g in groups:
+        for f in g.fields:
+            columns.AddColumn(f)
+
+    for writer in WRITERS:
+        filename = os.path.join(output_dir, "bench." + writer)
+        timed("write_" + writer, WriteBoM, filename, groups, net, columns.columns, prefs)
+
+    return times
+
+
+def benchmark(sizes, repeat):
+    """
+    Run the benchmark for each netlist size.
+    Returns a dict of size -> {phase: seconds}
+    """
+
+    results = {}
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        for size in sizes:
+            fname = os.path.join(tmp_dir, "bench_{n}.xml".format(n=size))
+
+            with open(fname, 'w') as f:
+                netlist_gen.generate(f, components=size, libparts=max(10, size // 20), fields=3, variants=2)
+
+            best = {}
+
+            for i in range(repeat):
+                for phase, t in runPhases(fname, tmp_dir).items():
+                    best[phase] = min(t, best.get(phase, t))
+
+            results[str(size)] = best
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the results (and comparison against the baseline, if given).
+    Returns the number of phases which are slower than the baseline.
+    """
+
+    regressions = 0
+
+    header = "{size:>8}  {phase:<16}{time:>12}".format(size="Size", phase="Phase", time="Time (ms)")
+
+    if baseline:
+        header += "{base:>12}{ratio:>8}".format(base="Base (ms)", ratio="Ratio")
+
+    print(header)
+
+    for size in sorted(results.keys(), key=int):
+        for phase in PHASES:
+            if phase not in results[size]:
+                continue
+
+            t = results[size][phase]
+
+            line = "{size:>8}  {phase:<16}{time:>12.2f}".format(size=size, phase=phase, time=t * 1000)
+
+            base = baseline.get(size, {}).get(phase) if baseline else None
+
+            if base is not None:
+                ratio = t / base if base > 0 else 1.0
+
+                line += "{base:>12.2f}{ratio:>8.2f}".format(base=base * 1000, ratio=ratio)
+
+                if ratio > threshold and (t - base) > MIN_DIFFERENCE:
+                    line += "  SLOWER"
+                    regressions += 1
+
+            print(line)
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="KiBoM phase benchmarks")
+
+    parser.add_argument("--sizes", default=",".join([str(s) for s in SIZES]), help="Comma separated list of netlist sizes (number of components)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs for each size (the fastest is recorded)")
+    parser.add_argument("--output", help="Save the results to a JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Report phases which are slower than the baseline by this ratio")
+
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = benchmark(sizes, max(1, args.repeat))
+
+    baseline = None
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "kibom": KIBOM_VERSION,
+                "python": platform.python_version(),
+                "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+
+    sys.exit(1 if regressions else 0)
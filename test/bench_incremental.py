@@ -0,0 +1,102 @@
+"""
+Benchmark (and check) incremental grouping.
+
+For each size, a synthetic netlist is grouped once (to store the groups),
+then one component value is changed and the netlist is grouped again, both
+in full and incrementally. The two sets of groups must be identical.
+
+Usage: python test/bench_incremental.py [--sizes 10000,20000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.netlist_reader import netlist  # noqa: E402
+from kibom.preferences import BomPref  # noqa: E402
+
+import netlist_gen  # noqa: E402
+
+SIZES = [10000, 20000]
+
+
+def groupData(groups):
+    return [([c.getRef() for c in g.components], g.fields) for g in groups]
+
+
+def groupNetlist(fname, cache_dir, incremental):
+    """
+    Group the components in a netlist, returning (groups, time taken)
+    """
+
+    prefs = BomPref()
+    prefs.cacheDir = cache_dir
+
+    net = netlist(fname, prefs, skipNets=True)
+
+    start = time.perf_counter()
+    groups = net.groupComponents(net.getInterestingComponents(), incremental=incremental)
+
+    return groups, time.perf_counter() - start
+
+
+def benchmark(size, tmp_dir):
+
+    cache_dir = os.path.join(tmp_dir, "cache_{n}".format(n=size))
+
+    fname = os.path.join(tmp_dir, "incremental_{n}.xml".format(n=size))
+
+    with open(fname, 'w') as f:
+        netlist_gen.generate(f, components=size, libparts=max(10, size // 20), fields=3)
+
+    # First run (stores the groups)
+    groups, t_first = groupNetlist(fname, cache_dir, True)
+
+    # Change the value of one component
+    with open(fname) as f:
+        text = f.read()
+
+    text = text.replace("<value>", "<value>1", 1)
+
+    with open(fname, 'w') as f:
+        f.write(text)
+
+    full, t_full = groupNetlist(fname, cache_dir, False)
+    incremental, t_incremental = groupNetlist(fname, cache_dir, True)
+
+    assert groupData(full) == groupData(incremental), "Incremental groups do not match"
+
+    print("{n:>8}{first:>14.1f}{full:>14.1f}{inc:>14.1f}{speedup:>10.2f}".format(
+        n=size,
+        first=t_first * 1000,
+        full=t_full * 1000,
+        inc=t_incremental * 1000,
+        speedup=t_full / t_incremental))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="KiBoM incremental grouping benchmark")
+    parser.add_argument("--sizes", default=",".join([str(s) for s in SIZES]), help="Comma separated list of netlist sizes (number of components)")
+
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+
+    print("{n:>8}{first:>14}{full:>14}{inc:>14}{speedup:>10}".format(
+        n="Size", first="First (ms)", full="Full (ms)", inc="Incr. (ms)", speedup="Speedup"))
+
+    try:
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            benchmark(size, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("All tests passed... OK...")
@@ -0,0 +1,158 @@
+"""
+Memory benchmark for loading a netlist.
+
+A synthetic netlist with (at least) the requested number of xml elements is
+written to a temporary file, which is then loaded (including the nets).
+The memory allocated by the loaded netlist, and the peak memory used while
+loading it, are measured with tracemalloc.
+
+The netlist is loaded twice: with xmlElement as it is, and with a baseline
+element class which has a __dict__ instead of __slots__, and creates an
+empty dict and list for each element (instead of sharing NO_ATTRIBUTES and
+NO_CHILDREN).
+
+Usage: python test/bench_memory.py [elements]
+"""
+
+from __future__ import print_function
+
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.netlist_reader import netlist, xmlElement  # noqa: E402
+from kibom import netlist_reader  # noqa: E402
+from kibom.preferences import BomPref  # noqa: E402
+
+# Number of xml elements written for each component (and its net)
+COMPONENT_ELEMENTS = 13
+
+
+def writeNetlist(fname, elements):
+    """
+    Write a synthetic netlist containing (approximately) the given number of elements.
+    Returns the number of components.
+    """
+
+    n = max(1, elements // COMPONENT_ELEMENTS)
+
+    with open(fname, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<export version="D">\n')
+        f.write('  <design>\n    <source>bench.sch</source>\n  </design>\n  <components>\n')
+
+        for i in range(n):
+            f.write('    <comp ref="R{i}">\n'.format(i=i + 1))
+            f.write('      <value>{v}K</value>\n'.format(v=i % 100))
+            f.write('      <footprint>Resistor_SMD:R_0805</footprint>\n')
+            f.write('      <datasheet>~</datasheet>\n')
+            f.write('      <fields>\n')
+            f.write('        <field name="Manufacturer">Yageo</field>\n')
+            f.write('        <field name="MPN">RC0805-{v}K</field>\n'.format(v=i % 100))
+            f.write('      </fields>\n')
+            f.write('      <libsource lib="Device" part="R" description="Resistor"/>\n')
+            f.write('      <sheetpath names="/" tstamps="/"/>\n')
+            f.write('      <tstamp>{i:08X}</tstamp>\n'.format(i=i))
+            f.write('    </comp>\n')
+
+        f.write('  </components>\n  <libparts>\n')
+        f.write('    <libpart lib="Device" part="R">\n      <description>Resistor</description>\n    </libpart>\n')
+        f.write('  </libparts>\n  <nets>\n')
+
+        for i in range(n):
+            f.write('    <net code="{i}" name="N{i}">\n'.format(i=i))
+            f.write('      <node ref="R{a}" pin="1"/>\n'.format(a=i + 1))
+            f.write('      <node ref="R{b}" pin="2"/>\n'.format(b=(i + 1) % n + 1))
+            f.write('    </net>\n')
+
+        f.write('  </nets>\n</export>\n')
+
+    return n
+
+
+def countElements(element):
+    count = 0
+    stack = [element]
+    while stack:
+        element = stack.pop()
+        count += 1
+        stack.extend(element.children)
+    return count
+
+
+def baselineElement():
+    """
+    Return a copy of the xmlElement class, without __slots__ or the shared empty attributes and children
+    """
+
+    members = dict([(k, v) for k, v in vars(xmlElement).items() if k not in xmlElement.__slots__ + ("__slots__",)])
+
+    def __init__(self, name, parent=None):
+        xmlElement.__init__(self, name, parent)
+        self.attributes = {}
+        self.children = []
+
+    members["__init__"] = __init__
+
+    return type("baselineElement", (object,), members)
+
+
+def measure(fname, elementClass):
+    """
+    Load the netlist, with the given element class.
+    Returns (element count, retained memory, peak memory)
+    """
+
+    netlist_reader.xmlElement = elementClass
+
+    try:
+        prefs = BomPref()
+
+        gc.collect()
+        tracemalloc.start()
+
+        net = netlist(fname, prefs)
+
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        netlist_reader.xmlElement = xmlElement
+
+    assert type(net.tree) is elementClass
+
+    return countElements(net.tree), current, peak
+
+
+def benchmark(elements):
+
+    fd, fname = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+
+    try:
+        n = writeNetlist(fname, elements)
+
+        count, base_current, base_peak = measure(fname, baselineElement())
+        count, current, peak = measure(fname, xmlElement)
+
+        print("Components: {n}".format(n=n))
+        print("Elements:   {c}".format(c=count))
+
+        for name, c, p in [("Baseline", base_current, base_peak), ("Slots", current, peak)]:
+            print("{name:10s}  retained {m:.1f} MB ({b:.0f} bytes per element), peak {p:.1f} MB".format(
+                name=name + ":", m=c / 1e6, b=c / count, p=p / 1e6))
+
+        print("Reduction:  retained {r:.0%}, peak {p:.0%}".format(r=1 - current / base_current, p=1 - peak / base_peak))
+
+    finally:
+        os.remove(fname)
+
+
+if __name__ == '__main__':
+
+    elements = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    benchmark(elements)
@@ -0,0 +1,272 @@
+"""
+Synthetic KiCad generic netlist generator.
+
+Writes a netlist (in the same format as an eeschema "generic" netlist export)
+with a configurable number of components, library parts, fields etc, for
+testing and benchmarking large designs.
+
+Usage: python test/netlist_gen.py [options] output.xml
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import sys
+
+from xml.sax.saxutils import escape, quoteattr
+
+# Library parts which are generated: (reference prefix, [values])
+PART_TYPES = [
+    ("R", ["10K", "10k", "10000", "4K7", "4.7k", "100R", "1M", "0R1", "47R", "10KR"]),
+    ("C", ["100n", "0.1uF", "100nF", "10u", "10uF", "1n", "22pF", "4u7"]),
+    ("L", ["10uH", "4u7", "100nH", "1mH"]),
+    ("D", ["1N4148", "BAT54", "LED"]),
+    ("U", ["STM32", "LM358", "74HC595"]),
+    ("Q", ["2N7002", "BC847"]),
+    ("J", ["Conn_01x02", "Conn_01x04", "USB_B"]),
+]
+
+FOOTPRINTS = [
+    "Resistor_SMD:R_0603",
+    "Resistor_SMD:R_0805",
+    "Capacitor_SMD:C_0603",
+    "Package_SO:SOIC-8",
+    "Connector:Conn_01x02",
+]
+
+# Values used for the generic component fields
+FIELD_VALUES = ["Yageo", "Vishay", "Murata", "TDK", "", "ABC-123", "abc-123"]
+
+
+def generate(out, components=1000, libparts=20, aliases=0.2, fields=2, variants=0, dnf=0.05, nets=None, nodes=3, seed=1):
+    """
+    Write a netlist to the (open) file 'out'.
+
+    components -- Number of components
+    libparts -- Number of library parts
+    aliases -- Fraction of components which reference a library part by an alias
+    fields -- Number of generic fields for each component
+    variants -- Number of variants (V1, V2, ...), which are assigned by the 'Config' field and variant fields
+    dnf -- Fraction of components which are not fitted
+    nets -- Number of nets (defaults to the number of components)
+    nodes -- Number of nodes in each net
+
+    Returns the number of xml elements which were written.
+    """
+
+    rnd = random.Random(seed)
+
+    if nets is None:
+        nets = components
+
+    libparts = max(1, libparts)
+
+    # (lib, part, alias, prefix, values) for each library part
+    parts = []
+
+    for i in range(libparts):
+        prefix, values = PART_TYPES[i % len(PART_TYPES)]
+        part = "{p}_{i}".format(p=prefix, i=i)
+        parts.append(("Lib{n}".format(n=i % 10), part, part + "_Alias", prefix, values))
+
+    variant_names = ["V{n}".format(n=n + 1) for n in range(variants)]
+
+    w = out.write
+
+    elements = 0
+
+    w('<?xml version="1.0" encoding="UTF-8"?>\n')
+    w('<export version="D">\n')
+    w('  <design>\n')
+    w('    <source>/synthetic/synthetic.sch</source>\n')
+    w('    <date>01/01/2020 12:00:00</date>\n')
+    w('    <tool>Eeschema (synthetic)</tool>\n')
+    w('    <sheet number="1" name="/" tstamps="/">\n')
+    w('      <title_block>\n')
+    w('        <title>Synthetic</title>\n')
+    w('        <rev>A</rev>\n')
+    w('        <date>2020-01-01</date>\n')
+    w('      </title_block>\n')
+    w('    </sheet>\n')
+    w('  </design>\n')
+    w('  <components>\n')
+    elements += 11
+
+    refs = []
+    counters = {}
+
+    for i in range(components):
+        lib, part, alias, prefix, values = rnd.choice(parts)
+
+        counters[prefix] = counters.get(prefix, 0) + 1
+        ref = "{p}{n}".format(p=prefix, n=counters[prefix])
+        refs.append(ref)
+
+        comp_fields = []
+
+        for n in range(fields):
+            comp_fields.append(("Field{n}".format(n=n + 1), rnd.choice(FIELD_VALUES)))
+
+        config = []
+
+        if rnd.random() < dnf:
+            config.append("DNF")
+
+        if variant_names and rnd.random() < 0.3:
+            config.append(rnd.choice(["+", "-"]) + rnd.choice(variant_names))
+
+        if config:
+            comp_fields.append(("Config", ",".join(config)))
+
+        if variant_names and rnd.random() < 0.1:
+            comp_fields.append(("{v}:Value".format(v=rnd.choice(variant_names)), rnd.choice(values)))
+
+        comp_fields = [f for f in comp_fields if f[1]]
+
+        w('    <comp ref={r}>\n'.format(r=quoteattr(ref)))
+        w('      <value>{v}</value>\n'.format(v=escape(rnd.choice(values))))
+        w('      <footprint>{f}</footprint>\n'.format(f=escape(rnd.choice(FOOTPRINTS))))
+        w('      <datasheet>~</datasheet>\n')
+        elements += 4
+
+        if comp_fields:
+            w('      <fields>\n')
+            for name, value in comp_fields:
+                w('        <field name={n}>{v}</field>\n'.format(n=quoteattr(name), v=escape(value)))
+            w('      </fields>\n')
+            elements += 1 + len(comp_fields)
+
+        if rnd.random() < aliases:
+            part = alias
+
+        w('      <libsource lib={l} part={p} description="Synthetic part"/>\n'.format(l=quoteattr(lib), p=quoteattr(part)))
+        w('      <sheetpath names="/" tstamps="/"/>\n')
+        w('      <tstamp>{t:08X}</tstamp>\n'.format(t=i + 1))
+        w('    </comp>\n')
+        elements += 3
+
+    w('  </components>\n')
+    w('  <libparts>\n')
+    elements += 1
+
+    for lib, part, alias, prefix, values in parts:
+        w('    <libpart lib={l} part={p}>\n'.format(l=quoteattr(lib), p=quoteattr(part)))
+        elements += 1
+
+        if aliases > 0:
+            w('      <aliases>\n')
+            w('        <alias>{a}</alias>\n'.format(a=escape(alias)))
+            w('      </aliases>\n')
+            elements += 2
+
+        w('      <description>Synthetic {p}</description>\n'.format(p=escape(part)))
+        w('      <docs>http://example.com/{p}.pdf</docs>\n'.format(p=escape(part)))
+        w('      <fields>\n')
+        w('        <field name="Reference">{r}</field>\n'.format(r=prefix))
+        w('        <field name="Value">{v}</field>\n'.format(v=escape(values[0])))
+        w('        <field name="Footprint">{f}</field>\n'.format(f=escape(FOOTPRINTS[0])))
+        w('      </fields>\n')
+        w('      <pins>\n')
+        w('        <pin num="1" name="~" type="passive"/>\n')
+        w('        <pin num="2" name="~" type="passive"/>\n')
+        w('      </pins>\n')
+        w('    </libpart>\n')
+        elements += 9
+
+    w('  </libparts>\n')
+    w('  <libraries>\n')
+    elements += 1
+
+    for n in range(min(libparts, 10)):
+        w('    <library logical="Lib{n}">\n'.format(n=n))
+        w('      <uri>/synthetic/Lib{n}.lib</uri>\n'.format(n=n))
+        w('    </library>\n')
+        elements += 2
+
+    w('  </libraries>\n')
+    w('  <nets>\n')
+    elements += 1
+
+    for n in range(nets):
+        w('    <net code="{c}" name="Net-{c}">\n'.format(c=n + 1))
+        elements += 1
+
+        if refs:
+            for pin in range(nodes):
+                w('      <node ref={r} pin="{p}"/>\n'.format(r=quoteattr(rnd.choice(refs)), p=pin + 1))
+                elements += 1
+
+        w('    </net>\n')
+
+    w('  </nets>\n')
+    w('</export>\n')
+
+    return elements
+
+
+def addFields(source, dest, fields):
+    """
+    Copy the netlist 'source' to 'dest', adding fields to some of the components.
+
+    fields -- {reference: [(field name, value)]}
+    """
+
+    with open(source, 'r') as f:
+        text = f.read()
+
+    for ref, values in fields.items():
+        start = text.index('<comp ref="{r}">'.format(r=ref))
+        end = text.index('</comp>', start)
+
+        comp = text[start:end]
+
+        added = "".join(['        <field name={n}>{v}</field>\n'.format(n=quoteattr(n), v=escape(v)) for n, v in values])
+
+        if '</fields>' in comp:
+            comp = comp.replace('      </fields>', added + '      </fields>')
+        else:
+            comp = comp.replace('      <libsource', '      <fields>\n' + added + '      </fields>\n      <libsource')
+
+        text = text[:start] + comp + text[end:]
+
+    with open(dest, 'w') as f:
+        f.write(text)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic KiCad netlist")
+
+    parser.add_argument("output", help="Output file ('-' for stdout)")
+    parser.add_argument("-n", "--components", type=int, default=1000, help="Number of components")
+    parser.add_argument("--libparts", type=int, default=20, help="Number of library parts")
+    parser.add_argument("--aliases", type=float, default=0.2, help="Fraction of components which use a part alias")
+    parser.add_argument("--fields", type=int, default=2, help="Number of generic fields per component")
+    parser.add_argument("--variants", type=int, default=0, help="Number of variants")
+    parser.add_argument("--dnf", type=float, default=0.05, help="Fraction of components which are not fitted")
+    parser.add_argument("--nets", type=int, default=None, help="Number of nets (default: number of components)")
+    parser.add_argument("--nodes", type=int, default=3, help="Number of nodes per net")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+
+    args = parser.parse_args()
+
+    options = dict(
+        components=args.components,
+        libparts=args.libparts,
+        aliases=args.aliases,
+        fields=args.fields,
+        variants=args.variants,
+        dnf=args.dnf,
+        nets=args.nets,
+        nodes=args.nodes,
+        seed=args.seed,
+    )
+
+    if args.output == '-':
+        generate(sys.stdout, **options)
+    else:
+        with open(args.output, 'w') as f:
+            elements = generate(f, **options)
+
+        print("{e} elements -> {f}".format(e=elements, f=args.output))
@@ -1,7 +1,13 @@
 from __future__ import print_function
 
 import csv
+import json
 import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
 
 
 def check_files_exist():
@@ -16,10 +22,129 @@ def check_files_exist():
     assert(os.path.exists('test/bom-out_bom_A.xml'))
     assert(os.path.exists('test/bom-out_bom_A.html'))
 
+    assert(os.path.exists('test/bom-multi_bom_A.csv'))
+    assert(os.path.exists('test/bom-multi_bom_A.xlsx'))
+    assert(os.path.exists('test/bom-multi_bom_A.xml'))
+    assert(os.path.exists('test/bom-multi_bom_A.html'))
+
     assert(os.path.exists('test/bomsubdir/bom-dir_bom_A.csv'))
     assert(os.path.exists('test/bomsubdir/secondsubdir/bom-dir2_bom_A.html'))
 
 
+def check_cache():
+    """
+    Test that the BOMs generated from the netlist cache (and incrementally) match the original
+    """
+
+    print("Checking netlist cache...")
+
+    cache = [f for f in os.listdir('test/bomcache') if f.endswith('.kibomcache')]
+
+    assert len(cache) > 0
+
+    with open('test/bom-out_bom_A.csv', 'r') as f:
+        expected = f.read()
+
+    with open('test/bom-cache_bom_A.csv', 'r') as f:
+        assert f.read() == expected
+
+    with open('test/bom-incremental_bom_A.csv', 'r') as f:
+        assert f.read() == expected
+
+
+def check_profile():
+    """
+    Test that the profile includes all of the output files
+    """
+
+    print("Checking profile...")
+
+    stats = pstats.Stats('test/bom-timings_bom_A.prof')
+
+    files = set([os.path.basename(f) for f, line, name in stats.stats.keys()])
+
+    assert 'csv_writer.py' in files
+    assert 'xlsx_writer.py' in files
+
+
+def check_timings():
+    """
+    Test that the total time is the wall time of the run (not the sum of the stages)
+    """
+
+    print("Checking timings...")
+
+    with open('test/bom-timings.json', 'r') as f:
+        report = json.load(f)
+
+    stages = [s["stage"] for s in report["stages"]]
+
+    assert "parse" in stages
+    assert "write csv" in stages
+    assert "write xlsx" in stages
+
+    # Stages run one after the other with --profile, so the run takes at least as long as them
+    assert report["wall"] >= sum([s["wall"] for s in report["stages"]])
+
+
+def check_batch():
+    """
+    Test that the BOMs generated in batch mode match the original
+    """
+
+    print("Checking batch mode...")
+
+    with open('test/bom-batch.json', 'r') as f:
+        report = json.load(f)
+
+    assert len(report) == 1
+    assert report[0]['success']
+    assert report[0]['netlist'] == os.path.abspath('test/kibom-test.xml')
+
+    assert(os.path.exists('test/bom-batch_bom_A.html'))
+
+    with open('test/bom-out_bom_A.csv', 'r') as f:
+        expected = f.read()
+
+    with open('test/bom-batch_bom_A.csv', 'r') as f:
+        assert f.read() == expected
+
+    with open('test/bom-manifest_bom_A.csv', 'r') as f:
+        assert f.read() == expected
+
+
+def check_batch_outputs():
+    """
+    Test that batch mode fails if several netlists would write the same output file
+    """
+
+    print("Checking batch output files...")
+
+    tmp_dir = tempfile.mkdtemp()
+
+    env = dict(os.environ, PYTHONPATH=os.path.abspath('.'))
+
+    try:
+        for name in ['a.xml', 'b.xml']:
+            shutil.copy('test/kibom-test.xml', os.path.join(tmp_dir, name))
+
+        args = [sys.executable, '-m', 'kibom', '--batch', os.path.join(tmp_dir, '*.xml'), '--jobs', '1']
+
+        result = subprocess.run(args + ['-o', 'bom.csv'], env=env, stdout=subprocess.PIPE, universal_newlines=True)
+
+        assert result.returncode != 0
+        assert 'would be written for 2 netlists' in result.stdout
+        assert not [f for f in os.listdir(tmp_dir) if f.endswith('.csv')]
+
+        result = subprocess.run(args + ['-o', '%O.csv'], env=env, stdout=subprocess.DEVNULL)
+
+        assert result.returncode == 0
+        assert os.path.exists(os.path.join(tmp_dir, 'a_bom_A.csv'))
+        assert os.path.exists(os.path.join(tmp_dir, 'b_bom_A.csv'))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
 def check_csv_data():
     """
     Test the generated CSV data
@@ -79,6 +204,11 @@ if __name__ == '__main__':
     print("Running BOM tests")
 
     check_files_exist()
+    check_cache()
+    check_profile()
+    check_timings()
+    check_batch()
+    check_batch_outputs()
     check_csv_data()
 
     print("All tests passed... OK...")
@@ -0,0 +1,718 @@
+from __future__ import print_function
+
+import os
+import random
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.netlist_reader import netlist, xmlElement  # noqa: E402
+from kibom.preferences import BomPref  # noqa: E402
+from kibom.columns import ColumnList  # noqa: E402
+from kibom.component import Component, ComponentGroup, FitRule, DNF, DNC, compactRefs  # noqa: E402
+from kibom.sort import natural_sort  # noqa: E402
+from kibom import grouping  # noqa: E402
+from kibom import units  # noqa: E402
+from kibom import debug  # noqa: E402
+from kibom.__main__ import readNetlist  # noqa: E402
+from kibom.netlist_cache import treeRecords  # noqa: E402
+
+import netlist_gen  # noqa: E402
+
+NETLIST = os.path.join(os.path.dirname(__file__), "kibom-test.xml")
+
+# Values which cover the non-transitive cases (see grouping.py)
+VALUES = [
+    "10K", "10k", "10000", "10KR", "10KF", "10K ",
+    "1M", "1m", "1meg", "0.001", "1000000",
+    "4K7", "4.7k", "4700", "DNF", "abc", "ABC",
+]
+
+LIBS = ["Device", "Connector", "Connector_Generic"]
+
+PARTS = ["R", "R_Small", "C", "C_Small", "SW"]
+
+
+def group_refs(groups):
+    return [[c.getRef() for c in g.components] for g in groups]
+
+
+def check_groups(prefs, rounds=50):
+    """
+    Test that the key-based grouping matches the pairwise grouping
+    """
+
+    net = netlist(NETLIST, prefs=prefs)
+
+    components = net.getInterestingComponents()
+
+    rnd = random.Random(1)
+
+    for i in range(rounds):
+        for c in components:
+            c.setValue(rnd.choice(VALUES))
+            c.setField("lib", rnd.choice(LIBS))
+            c.setField("part", rnd.choice(PARTS))
+
+        # Duplicate references must only be counted once
+        components_dup = components + components[:3]
+
+        expected = group_refs(grouping.groupPairwise(components_dup, prefs))
+        actual = group_refs(grouping.groupComponents(components_dup, prefs))
+
+        assert expected == actual, "Groups do not match: {a} != {b}".format(a=expected, b=actual)
+
+
+def check_grouping():
+
+    print("Checking component grouping...")
+
+    prefs = BomPref()
+    check_groups(prefs)
+
+    prefs = BomPref()
+    prefs.groupConnectors = False
+    prefs.mergeBlankFields = False
+    check_groups(prefs)
+
+    # Without grouping by library, connectors can be mixed with other parts
+    prefs = BomPref()
+    prefs.groups = [ColumnList.COL_PART, ColumnList.COL_VALUE, ColumnList.COL_FP]
+    check_groups(prefs)
+
+    # Part name in multiple alias lists
+    prefs = BomPref()
+    prefs.aliases.append(["r", "c"])
+    check_groups(prefs)
+
+    # No grouping fields
+    prefs = BomPref()
+    prefs.groups = []
+    check_groups(prefs)
+
+
+def check_aggregates():
+    """
+    Test the (cached) group counts, as components are added
+    """
+
+    print("Checking group aggregates...")
+
+    prefs = BomPref()
+    prefs.boards = 3
+
+    net = netlist(NETLIST, prefs=prefs)
+
+    components = net.getInterestingComponents()
+
+    fitted = [c for c in components if c.isFitted() and not c.isFixed()]
+    dnf = [c for c in components if not c.isFitted()]
+    dnc = [c for c in components if c.isFixed()]
+
+    assert len(fitted) > 1 and len(dnf) > 0 and len(dnc) > 0
+
+    g = ComponentGroup(prefs=prefs)
+    g.appendComponent(dnf[0])
+
+    assert g.getCount() == 1
+    assert not g.isFitted()
+    assert g.getFittedCount() == 0
+    assert g.getBuildCount() == 0
+
+    # Adding a fitted component makes the group fitted
+    g.appendComponent(fitted[0])
+    g.appendComponent(fitted[1])
+
+    assert g.getCount() == 3
+    assert g.isFitted()
+    assert not g.isFixed()
+    assert g.getFittedCount() == 3
+    assert g.getBuildCount() == 9
+
+    g.appendComponent(dnc[0])
+
+    assert g.isFixed()
+
+    g.setComponents(dnf[:1])
+
+    assert g.getCount() == 1
+    assert not g.isFitted()
+
+    for g in net.groupComponents(components):
+        assert g.getCount() == len(g.components)
+        assert g.isFitted() == any([c.isFitted() for c in g.components])
+        assert g.isFixed() == any([c.isFixed() for c in g.components])
+        assert g.getField(ColumnList.COL_GRP_BUILD_QUANTITY) == str(g.getBuildCount())
+
+
+def fitted_reference(value, check, pcbConfig):
+    """
+    Reference version of Component.isFitted (without the 'dnp' property), from before FitRule
+    """
+
+    if value.lower() in DNF:
+        return False
+
+    check = check.lower()
+
+    if check == "":
+        return True
+
+    for opt in check.split(" "):
+        if opt.lower() in DNF:
+            return False
+
+    opts = check.split(",")
+
+    for opt in opts:
+        opt = opt.strip()
+        if opt in DNF:
+            return False
+        if opt.startswith("-") and opt[1:] in pcbConfig:
+            return False
+
+    exclusive = False
+
+    for opt in opts:
+        if opt.startswith("+"):
+            exclusive = True
+            if opt[1:] in pcbConfig:
+                return True
+
+    return not exclusive
+
+
+def fixed_reference(value, check):
+    """
+    Reference version of Component.isFixed, from before FitRule
+    """
+
+    if value.lower() in DNC:
+        return True
+
+    check = check.lower()
+
+    if check == "":
+        return False
+
+    for opt in check.split(" ") + check.split(","):
+        if opt.lower() in DNC:
+            return True
+
+    return False
+
+
+def check_fit_rules():
+    """
+    Test that the fit rules match the original isFitted / isFixed logic
+    """
+
+    print("Checking fit rules...")
+
+    rnd = random.Random(1)
+
+    options = ["+A", "-A", "+B", "-b", " +C", "-C ", "DNF", "dnc", "Fixed", "no stuff", "A", "+", "-", ""]
+    values = ["10K", "DNF", "dnc", "", "Do Not Fit"]
+    variants = [["default"], ["a"], ["b"], ["a", "b"], ["c"], [""]]
+
+    for i in range(2000):
+        opts = [rnd.choice(options) for n in range(rnd.randint(0, 3))]
+        check = rnd.choice([",", ", ", " "]).join(opts)
+        value = rnd.choice(values)
+
+        rule = FitRule(False, value, check)
+
+        for pcbConfig in variants:
+            assert rule.isFitted(frozenset(pcbConfig)) == fitted_reference(value, check, pcbConfig), (value, check, pcbConfig)
+
+        assert rule.isFixed() == fixed_reference(value, check), (value, check)
+
+        assert not FitRule(True, value, check).isFitted(frozenset(["default"]))
+
+
+def make_components(refs):
+    components = []
+
+    for ref in refs:
+        element = xmlElement("comp")
+        element.addAttribute("ref", ref)
+        components.append(Component(element))
+
+    return components
+
+
+def check_refs():
+    """
+    Test the reference ranges (use_alt)
+    """
+
+    print("Checking reference ranges...")
+
+    assert make_components(["U12"])[0].getRefParts() == ("U", 12, "")
+    assert make_components(["U3A"])[0].getRefParts() == ("U", 3, "A")
+    assert make_components(["R1.2"])[0].getRefParts() == ("R1.", 2, "")
+    assert make_components(["X"])[0].getRefParts() == ("X", None, "")
+    assert make_components(["#PWR01"])[0].getSuffix() == 1
+
+    cases = [
+        (["C1", "C2", "C3", "C4", "C7"], "C1-C4, C7"),
+        (["C1", "C3", "C5"], "C1, C3, C5"),
+        (["C1", "C2"], "C1-C2"),
+        (["C9", "D10", "D11"], "C9, D10-D11"),
+        (["U1A", "U2A", "U3B"], "U1A-U2A, U3B"),
+        (["R1.1", "R1.2", "R1.3", "R2.1"], "R1.1-R1.3, R2.1"),
+        (["J", "K", "K1", "K2"], "J, K, K1-K2"),
+        (["#PWR09", "#PWR010"], "#PWR09-#PWR010"),
+        # Zero padded numbers are printed as written
+        (["R01", "R02", "R03", "R05"], "R01-R03, R05"),
+        (["R08", "R09", "R10", "R11"], "R08-R11"),
+        # Ranges never span prefixes
+        (["R1", "RN2", "RN3", "RN4"], "R1, RN2-RN4"),
+        (["R1", "R2", "RV3", "RV4"], "R1-R2, RV3-RV4"),
+        (["#FLG01", "#PWR01", "#PWR02", "#PWR03"], "#FLG01, #PWR01-#PWR03"),
+        (["#PWR01", "#PWR02", "PWR03"], "#PWR01-#PWR02, PWR03"),
+        ([], ""),
+    ]
+
+    for refs, expected in cases:
+        actual = compactRefs(make_components(refs), ",")
+        assert actual == expected, "{r}: '{a}' != '{e}'".format(r=refs, a=actual, e=expected)
+
+    # Large group
+    refs = ["C{n}".format(n=n) for n in range(1, 5001) if n % 100 != 0]
+
+    assert compactRefs(make_components(refs), ",").startswith("C1-C99, C101-C199, ")
+
+    assert compactRefs(make_components(["C1", "C3", "C5", "C7"]), ",", N=2) == "C1, C3\nC5, C7"
+
+
+def check_sort_order():
+    """
+    Test the (cached) sort keys, and the configurable BoM order
+    """
+
+    print("Checking sort order...")
+
+    prefs = BomPref()
+
+    net = netlist(NETLIST, prefs=prefs)
+    groups = net.groupComponents(net.getInterestingComponents())
+
+    # Default order is the prefix, then the value
+    expected = sorted(groups, key=lambda g: [g.components[0].getPrefix(), g.components[0].getValueSort()])
+    assert group_refs(net.sortGroups(groups)) == group_refs(expected)
+
+    c = groups[0].components[0]
+    assert c.getSortKey("value") is c.getSortKey("value")
+    assert c.getSortKey("reference") == natural_sort(c.getRef())
+
+    # Keys are recalculated when the component changes
+    c.setValue("abc")
+    assert c.getSortKey("value") == "abc"
+
+    # Multiple keys, most significant first
+    prefs.sortOrder = ["-prefix", "reference"]
+    expected = sorted(groups, key=lambda g: natural_sort(g.components[0].getRef()))
+    expected = sorted(expected, key=lambda g: g.components[0].getPrefix(), reverse=True)
+    assert group_refs(net.sortGroups(groups)) == group_refs(expected)
+
+    prefs.sortOrder = ["footprint", "-value"]
+    expected = sorted(groups, key=lambda g: g.components[0].getValueSort(), reverse=True)
+    expected = sorted(expected, key=lambda g: natural_sort(g.components[0].getFootprint()))
+    assert group_refs(net.sortGroups(groups)) == group_refs(expected)
+
+
+def check_field_merge():
+    """
+    Test merging the fields of the components in a group
+    """
+
+    print("Checking field merging...")
+
+    cases = [
+        (["10", "100", "10"], "10 100"),
+        (["100", "10"], "100 10"),
+        (["Yageo", "yageo ", "TDK", "", "Murata", "tdk"], "Yageo TDK Murata"),
+        (["", ""], None),
+    ]
+
+    for values, expected in cases:
+        g = ComponentGroup()
+
+        for value in values:
+            g.updateField("MPN", value)
+
+        g.mergeFields()
+
+        assert g.fields.get("MPN") == expected, "{v}: '{a}' != '{e}'".format(v=values, a=g.fields.get("MPN"), e=expected)
+
+    # Values are added to the current value
+    g = ComponentGroup()
+    g.fields["MPN"] = "100"
+    g.updateField("MPN", "10")
+    g.updateField("MPN", "100")
+    g.mergeFields()
+
+    assert g.fields["MPN"] == "100 10"
+
+
+def check_pref_classes():
+    """
+    Test that every preference is either a grouping setting or not (see incremental.stateKey)
+    """
+
+    print("Checking preference classes...")
+
+    grouping_prefs = set(BomPref.GROUPING_PREFS)
+    other_prefs = set(BomPref.OTHER_PREFS)
+
+    assert not grouping_prefs & other_prefs
+
+    prefs = BomPref()
+    prefs.Read(os.path.join(os.path.dirname(__file__), "bom.ini"))
+
+    # Includes the attributes set when the preferences are read
+    names = set(vars(prefs).keys())
+
+    assert names == grouping_prefs | other_prefs, "Unclassified preferences: {p}".format(p=sorted(names - grouping_prefs - other_prefs))
+
+    assert [name for name, value in prefs.groupingSettings()] == BomPref.GROUPING_PREFS
+
+
+def check_value_cache():
+    """
+    Test the size of the parsed value cache (value_cache_size)
+    """
+
+    print("Checking value cache...")
+
+    fname = os.path.join(tempfile.mkdtemp(), "bom.ini")
+
+    prefs = BomPref()
+    prefs.valueCacheSize = 16
+    prefs.Write(fname)
+
+    prefs = BomPref()
+    prefs.Read(fname)
+
+    assert prefs.valueCacheSize == 16
+
+    units.setCacheSize(prefs.valueCacheSize)
+
+    assert units.compareValues("4K7", "4.7k")
+    assert units.compareValues("4K7", "4.7k")
+    assert units.cacheInfo() == (2, 2)
+
+    # Unchanged size, the cache is kept
+    units.setCacheSize(16)
+    assert units.cacheInfo() == (2, 2)
+
+    units.setCacheSize(0)
+    assert units.compareValues("4K7", "4.7k")
+    assert units.cacheInfo() == (0, 0)
+
+    units.setCacheSize(units.CACHE_SIZE)
+
+    os.remove(fname)
+
+
+def check_parsed_values():
+    """
+    Test that comparing parsed values gives the same result as comparing the value strings
+    """
+
+    print("Checking parsed values...")
+
+    values = VALUES + ["0R1", "0.1ohm", "100n", "0.1uF", "10KF", "3.3mOhm", "1,000", ""]
+
+    for v1 in values:
+        for v2 in values:
+            r1 = units.compMatch(v1)
+            r2 = units.compMatch(v2)
+
+            expected = units.compareValues(v1, v2)
+
+            if r1 and r2:
+                assert units.compareValues(r1, r2) == expected, (v1, v2)
+                assert units.compareValues(r1, v2) == expected, (v1, v2)
+            else:
+                assert not expected
+
+    c = make_components(["R1"])[0]
+    c.element.addChild(xmlElement("value", c.element))
+
+    c.setValue("4K7")
+    assert c.getParsedValue() == units.compMatch("4K7")
+    assert c.getParsedValue() is c.getParsedValue()
+
+    c.setValue("abc")
+    assert c.getParsedValue() is None
+
+
+def check_field_cache():
+    """
+    Test that resolved field values are discarded when a field is changed,
+    and that libraryToo=False does not use (or fill) the resolved values
+    """
+
+    print("Checking field cache...")
+
+    fname = os.path.join(tempfile.mkdtemp(), "fields.xml")
+    netlist_gen.addFields(NETLIST, fname, {"R1": [("Tolerance", ""), ("Notes", "first")]})
+
+    # Add a library field for the (empty) component field
+    with open(fname, 'r') as f:
+        text = f.read()
+
+    with open(fname, 'w') as f:
+        f.write(text.replace('<field name="Value">R</field>', '<field name="Value">R</field>\n        <field name="Tolerance">5%</field>'))
+
+    net = readNetlist(fname, BomPref())
+    r1 = [c for c in net.components if c.getRef() == "R1"][0]
+
+    # libraryToo=False is resolved each time, and does not change the stored values
+    assert r1.getField("Tolerance", libraryToo=False) == ""
+    assert r1.getField("Tolerance") == "5%"
+    assert r1.getField("tolerance", libraryToo=False) == ""
+    assert r1.getField("TOLERANCE") == "5%"
+
+    assert r1.getField("Notes") == "first"
+    assert r1.getField("Value") == "10000"
+
+    # setField changes the netlist
+    r1.setField("Notes", "second")
+    assert r1.getField("notes") == "second"
+    assert r1.getField("Notes", libraryToo=False) == "second"
+
+    r1.setField("Value", "10K")
+    assert r1.getField("Value") == "10K"
+
+    r1.setField("Tolerance", "1%")
+    assert r1.getField("Tolerance") == "1%"
+    assert r1.getField("Tolerance", libraryToo=False) == "1%"
+
+    # overlayField only changes the view
+    view = r1.view()
+    assert view.getField("Notes") == "second"
+
+    view.overlayField("Notes", "third")
+    view.overlayField("Value", "4K7")
+
+    assert view.getField("Notes") == "third"
+    assert view.getField("Notes", libraryToo=False) == "third"
+    assert view.getField("value") == "4K7"
+
+    assert r1.getField("Notes") == "second"
+    assert r1.getField("Value") == "10K"
+
+    os.remove(fname)
+
+
+# Regex rules, including several for the same field, and expressions with groups
+REGEX_RULES = [
+    ["References", "^R[0-9]$"],
+    ["Value", "^1"],
+    ["References", "^C(1|2)$"],
+    ["value", "k$"],
+    ["Footprint", "0805"],
+    ["References", "^(?P<prefix>[A-Z]+)1[0-9]"],
+    ["Config", "dn[fc]"],
+    ["Value", "4.?7"],
+]
+
+
+def regex_reference(component, rules):
+    """
+    Return the first rule which matches a component (searching each rule in turn), as RegexFilter.match
+    """
+
+    for field_name, regex in rules:
+        field_value = component.getField(field_name)
+        if re.search(regex, field_value, flags=re.IGNORECASE):
+            return (field_name, regex, field_value)
+
+    return None
+
+
+def check_regex_filters():
+    """
+    Test that the compiled (and combined) regex filters match each rule in turn
+    """
+
+    print("Checking regex filters...")
+
+    prefs = BomPref()
+    net = netlist(NETLIST, prefs=prefs)
+
+    components = net.getInterestingComponents()
+
+    rnd = random.Random(2)
+
+    for i in range(50):
+        rules = [list(r) for r in rnd.sample(REGEX_RULES, rnd.randint(0, len(REGEX_RULES)))]
+
+        prefs.regExcludes = rules
+        prefs.regIncludes = rules
+
+        for c in components:
+            expected = regex_reference(c, rules)
+
+            assert prefs.getRegExcludeFilter().match(c) == expected, (c.getRef(), rules)
+            assert c.testRegExclude() == (expected is not None)
+            assert c.testRegInclude() == (expected is not None or len(rules) == 0)
+
+    # Expressions are compiled once, and combined for each field (unless they contain groups)
+    prefs.regExcludes = [list(r) for r in REGEX_RULES]
+
+    f = prefs.getRegExcludeFilter()
+
+    assert prefs.getRegExcludeFilter() is f
+    assert len(f.rules) == len(REGEX_RULES)
+    assert len(f.fields) == 6
+
+
+def check_regex_errors():
+    """
+    Test that an invalid regex is reported once, when the preferences are read
+    """
+
+    print("Checking invalid regex...")
+
+    fname = os.path.join(tempfile.mkdtemp(), "bom.ini")
+
+    prefs = BomPref()
+    prefs.regExcludes = [["References", "^TP[0-9]*"], ["Value", "[unclosed"]]
+    prefs.Write(fname)
+
+    debug.resetErrorCount()
+
+    prefs = BomPref()
+    prefs.Read(fname)
+
+    assert debug.getErrorCount() == 1
+
+    net = netlist(NETLIST, prefs=prefs)
+
+    for c in net.getInterestingComponents():
+        c.testRegExclude()
+        c.testRegInclude()
+
+    assert debug.getErrorCount() == 1
+    assert len(prefs.getRegExcludeFilter().rules) == 1
+
+    debug.resetErrorCount()
+    os.remove(fname)
+
+
+# Variant fields added to the test netlist
+VARIANT_FIELDS = {
+    "R1": [("V1:Value", "22K")],
+    "R2": [("V1", "DNF")],
+    "R3": [("V1:Value", "2K2"), ("V2:Value", "1K"), ("V2:Footprint", "Resistor_SMD:R_0603")],
+    "R4": [("V2:Missing", "abc")],
+    "C1": [("V2", "DNP")],
+    "C2": [("V1", "fitted"), ("V2:Value", "DNF")],
+}
+
+
+def variants_reference(fname, pcbConfig):
+    """
+    Return the components for a variant, by modifying a newly read netlist
+    (as each component was modified before variants used views)
+    """
+
+    prefs = BomPref()
+    net = readNetlist(fname, prefs)
+
+    components = []
+
+    for c in net.getInterestingComponents():
+        fitted = True
+
+        for field in c.getFieldNames():
+            try:
+                variant_name, field_name = field.split(":")
+            except ValueError:
+                variant_name, field_name = field, ""
+
+            if variant_name.lower() not in pcbConfig:
+                continue
+
+            value = c.getField(field)
+
+            if value.lower() in DNF and not field_name:
+                fitted = False
+                break
+
+            c.setField(field_name, value)
+
+        if fitted:
+            components.append(c)
+
+    return components
+
+
+def component_data(components):
+    return [(c.getRef(), c.getFootprint(), [(f, c.getField(f)) for f in c.getFieldNames()]) for c in components]
+
+
+def check_variants():
+    """
+    Test that processing variants from the same netlist matches reading the netlist for each variant,
+    and that the netlist itself is not modified
+    """
+
+    print("Checking variants...")
+
+    fname = os.path.join(tempfile.mkdtemp(), "variants.xml")
+    netlist_gen.addFields(NETLIST, fname, VARIANT_FIELDS)
+
+    prefs = BomPref()
+    net = readNetlist(fname, prefs)
+
+    tree = treeRecords(net.tree)
+    original = component_data(net.getInterestingComponents())
+
+    # (as -r V1, -r V2, -r "V1;V2" and -r "V1,V2")
+    for config in [["v1"], ["v2"], ["v1"], ["v2"], ["v1", "v2"], ["v1"]]:
+        components = net.getVariantComponents(config)
+        expected = variants_reference(fname, config)
+
+        assert component_data(components) == component_data(expected), config
+
+        assert treeRecords(net.tree) == tree
+        assert component_data(net.getInterestingComponents()) == original
+
+    v1 = dict([(c.getRef(), c) for c in net.getVariantComponents(["v1"])])
+    v2 = dict([(c.getRef(), c) for c in net.getVariantComponents(["v2"])])
+
+    assert "R2" not in v1 and "R2" in v2
+    assert "C1" in v1 and "C1" not in v2
+    assert v1["R1"].getValue() == "22K" and v2["R1"].getValue() == "10000"
+    assert v1["R3"].getValue() == "2K2" and v2["R3"].getValue() == "1K"
+    assert v2["R3"].getFootprint() == "Resistor_SMD:R_0603"
+
+    os.remove(fname)
+
+
+if __name__ == '__main__':
+
+    print("Running grouping tests")
+
+    check_grouping()
+    check_aggregates()
+    check_fit_rules()
+    check_refs()
+    check_sort_order()
+    check_field_merge()
+    check_pref_classes()
+    check_value_cache()
+    check_parsed_values()
+    check_field_cache()
+    check_regex_filters()
+    check_regex_errors()
+    check_variants()
+
+    print("All tests passed... OK...")
@@ -0,0 +1,148 @@
+"""
+Import time regression test.
+
+Generating a CSV file must not import the other writers (or xlsxwriter),
+which are only imported when their format is requested (see bom_writer.WRITERS).
+
+Uses "python -X importtime", run from the top level directory.
+Modules loaded by importlib.import_module (such as the writers) are not listed
+by -X importtime, so the modules which were loaded are read from sys.modules.
+"""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom import bom_writer  # noqa: E402
+
+TEST_DIR = os.path.abspath(os.path.dirname(__file__))
+
+ENV = dict(os.environ, PYTHONPATH=os.path.dirname(TEST_DIR))
+
+# Run kibom, and print the loaded modules when it exits
+RUN = """
+import atexit, runpy, sys
+atexit.register(lambda: print("\\n".join("module: " + m for m in sorted(sys.modules))))
+sys.argv = ["kibom"] + sys.argv[1:]
+runpy.run_module("kibom", run_name="__main__", alter_sys=True)
+"""
+
+# Modules which are only needed for other output formats (or batch mode, or the SAX netlist parser)
+LAZY = [
+    "xml.sax.expatreader",
+    "kibom.html_writer",
+    "kibom.xml_writer",
+    "kibom.xlsx_writer",
+    "xlsxwriter",
+    "concurrent.futures.process",
+]
+
+
+def import_times(args):
+    """
+    Run kibom (with python -X importtime) with the given arguments.
+    Returns ({module: import time, excluding the modules it imports (us)}, set of loaded modules)
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUN] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=TEST_DIR,
+        env=ENV)
+
+    assert result.returncode == 0, result.stderr
+
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        fields = line[len("import time:"):].split("|")
+
+        try:
+            times[fields[2].strip()] = int(fields[0])
+        except ValueError:
+            # Header line
+            continue
+
+    modules = set([line[len("module: "):] for line in result.stdout.splitlines() if line.startswith("module: ")])
+
+    return times, modules
+
+
+def check_csv_imports():
+    """
+    Test that writing a CSV file only imports the CSV writer
+    """
+
+    print("Checking imports for CSV output...")
+
+    times, modules = import_times(["kibom-test.xml", "bom-imports.csv"])
+
+    assert "kibom.csv_writer" in modules
+    assert "csv" in times
+
+    for module in LAZY:
+        assert module not in modules, "{m} imported for CSV output".format(m=module)
+
+    total = sum([t for m, t in times.items() if m.startswith("kibom")])
+
+    print("kibom import time: {t:.1f} ms".format(t=total / 1000.0))
+
+
+def check_xlsx_imports():
+    """
+    Test that the XLSX writer is imported when required
+    """
+
+    print("Checking imports for XLSX output...")
+
+    times, modules = import_times(["kibom-test.xml", "bom-imports.xlsx"])
+
+    assert "kibom.xlsx_writer" in modules
+    assert "xlsxwriter" in modules
+    assert "kibom.html_writer" not in modules
+
+
+def check_register():
+    """
+    Test registering a writer for a new format
+    """
+
+    print("Checking writer registry...")
+
+    written = []
+
+    def WriteTest(filename, groups, net, headings, head_names, prefs):
+        written.append(filename)
+        return True
+
+    assert not bom_writer.isSupported(".kibomtest")
+
+    bom_writer.registerWriter(".kibomtest", WriteTest, name="Test")
+
+    assert bom_writer.isSupported(".kibomtest")
+    assert bom_writer.getWriter("kibomtest") == ("Test", WriteTest)
+
+    assert bom_writer.WriteBoM(os.path.join(TEST_DIR, "bom-imports.kibomtest"), [], None)
+    assert len(written) == 1
+
+    assert bom_writer.getWriter("unknown") is None
+
+
+if __name__ == '__main__':
+
+    print("Running import tests")
+
+    check_csv_imports()
+    check_xlsx_imports()
+    check_register()
+
+    print("All tests passed... OK...")
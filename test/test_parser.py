@@ -0,0 +1,551 @@
+"""
+Test that the expat netlist parser builds the same tree as the SAX parser.
+
+Compares the test netlist, synthetic netlists (see netlist_gen.py) and a
+netlist with awkward text (entities, unicode, multi-line values etc), then
+prints the time taken by each parser.
+
+Also checks that the indexed lookups of xmlElement.get give the same results
+as a recursive search, that skipping the <nets> and <libraries> sections gives the same
+components and library parts, and that invalid netlist cache entries are ignored.
+
+Usage: python test/test_parser.py [--size 20000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.netlist_reader import netlist, xmlElement  # noqa: E402
+from kibom.netlist_cache import treeRecords  # noqa: E402
+from kibom import netlist_cache  # noqa: E402
+from kibom import incremental  # noqa: E402
+from kibom.preferences import BomPref  # noqa: E402
+
+import netlist_gen  # noqa: E402
+
+NETLIST = os.path.join(os.path.dirname(__file__), "kibom-test.xml")
+
+# Text which is not simply copied from the file
+AWKWARD = u"""<?xml version="1.0" encoding="UTF-8"?>
+<export version="D">
+  <design>
+    <source>/tmp/awkward &amp; "quoted".sch</source>
+    <date>today</date>
+    <tool>Eeschema</tool>
+  </design>
+  <components>
+    <comp ref="R1">
+      <value>10K &lt;1%&gt;</value>
+      <footprint>Resistor_SMD:R_0603</footprint>
+      <fields>
+        <field name="Notes">first line
+          second line</field>
+        <field name="Unicode">µF Ω é</field>
+        <field name="Spaces">  padded  </field>
+        <field name="Entity">&#x3a9;&#65;<![CDATA[<raw> & text]]></field>
+        <field name="Empty"></field>
+      </fields>
+      <libsource lib="Device" part="R" description="a &quot;resistor&quot;"/>
+      <sheetpath names="/" tstamps="/"/>
+      <tstamp>5E1A2B3C</tstamp>
+    </comp>
+  </components>
+  <libparts>
+    <libpart lib="Device" part="R">
+      <aliases>
+        <alias>R_Small</alias>
+      </aliases>
+      <fields>
+        <field name="Reference">R</field>
+        <field name="Value">R</field>
+      </fields>
+    </libpart>
+  </libparts>
+  <libraries>
+    <library logical="Device">
+      <uri>/usr/share/kicad/library/Device.lib</uri>
+    </library>
+  </libraries>
+  <nets>
+    <net code="1" name="GND">
+      <node ref="R1" pin="1"/>
+    </net>
+  </nets>
+</export>
+"""
+
+
+def load(fname, parser, skipNets):
+    """
+    Load a netlist with the given parser, returning (netlist, time taken)
+    """
+
+    prefs = BomPref()
+    prefs.netlistParser = parser
+
+    start = time.perf_counter()
+    net = netlist(fname, prefs, skipNets=skipNets)
+
+    return net, time.perf_counter() - start
+
+
+def netlistData(net):
+    """
+    Return the tree, along with the components and library parts (and how they are linked)
+    """
+
+    libparts = [id(p) for p in net.libparts]
+
+    return (
+        treeRecords(net.tree),
+        [(c.getRef(), libparts.index(id(c.getLibPart())) if c.getLibPart() else None) for c in net.components],
+        len(net.libparts),
+        len(net.nets),
+        len(net.libraries),
+        treeRecords(net.design),
+    )
+
+
+def check_netlist(fname):
+    """
+    Test that both parsers read a netlist in the same way.
+    Returns the time taken by each parser (sax, expat).
+    """
+
+    times = []
+
+    for skipNets in [False, True]:
+        sax, t_sax = load(fname, "sax", skipNets)
+        expat, t_expat = load(fname, "expat", skipNets)
+
+        assert netlistData(sax) == netlistData(expat), "Parsers do not match for {f}".format(f=fname)
+
+        # Times with skipNets (as used to generate a BoM)
+        times = [t_sax, t_expat]
+
+    return times
+
+
+def check_netlists(tmp_dir, size):
+
+    print("Checking test netlist...")
+    check_netlist(NETLIST)
+
+    print("Checking awkward text...")
+
+    fname = os.path.join(tmp_dir, "awkward.xml")
+
+    with open(fname, 'wb') as f:
+        f.write(AWKWARD.encode('utf-8'))
+
+    check_netlist(fname)
+
+    net, t = load(fname, "expat", False)
+    fields = dict([(f.get("field", "name"), f.chars) for f in net.components[0].element.getChild("fields").getChildren()])
+
+    assert net.getSource() == 'awkward & "quoted".sch'
+    assert net.components[0].getValue() == "10K <1%>"
+    assert fields["Unicode"] == u"µF Ω é"
+    assert fields["Entity"] == u"ΩA<raw> & text"
+
+    print("Checking synthetic netlists...")
+
+    options = [
+        dict(components=100, seed=1),
+        dict(components=500, fields=5, variants=3, seed=2),
+        dict(components=500, libparts=200, aliases=0.5, dnf=0.3, seed=3),
+        dict(components=size, libparts=max(10, size // 20), fields=3),
+    ]
+
+    for option in options:
+        fname = os.path.join(tmp_dir, "synthetic.xml")
+
+        with open(fname, 'w') as f:
+            netlist_gen.generate(f, **option)
+
+        t_sax, t_expat = check_netlist(fname)
+
+    print("{n} components: sax {s:.1f} ms, expat {e:.1f} ms ({x:.2f}x)".format(
+        n=size, s=t_sax * 1000, e=t_expat * 1000, x=t_sax / t_expat))
+
+
+def referenceGet(element, elemName, attribute="", attrmatch=""):
+    """
+    Return the result of xmlElement.get, using a recursive depth-first search (as it did before the indexes)
+    """
+
+    if element.name == elemName:
+        if attribute != "":
+            if attrmatch != "":
+                if element.attributes[attribute] == attrmatch:
+                    return element.chars
+            else:
+                return element.attributes[attribute]
+        else:
+            return element.chars
+
+    for child in element.children:
+        ret = referenceGet(child, elemName, attribute, attrmatch)
+        if ret != "":
+            return ret
+
+    return ""
+
+
+def lookup(function, *args):
+    """Return the result of a lookup, or the type of exception which it raised"""
+
+    try:
+        return function(*args)
+    except KeyError:
+        return KeyError
+
+
+def allElements(element):
+    """Return an element and all of the elements below it (depth-first)"""
+
+    elements = [element]
+
+    for child in element.children:
+        elements.extend(allElements(child))
+
+    return elements
+
+
+def checkLookups(top, roots):
+    """
+    Compare get(), getChild() and getChildren() with a recursive search,
+    for every element name and attribute (and attribute value) in the tree, starting at each root
+    """
+
+    names = set(["missing"])
+    values = {"missing": set()}
+
+    for element in allElements(top):
+        names.add(element.name)
+
+        for attribute, value in element.attributes.items():
+            values.setdefault(attribute, set()).add(value)
+
+    queries = []
+
+    for name in sorted(names):
+        queries.append((name, "", ""))
+
+        for attribute in sorted(values):
+            queries.append((name, attribute, ""))
+            queries.append((name, attribute, "no match"))
+
+            for value in sorted(values[attribute]):
+                queries.append((name, attribute, value))
+
+    for root in roots:
+        for query in queries:
+            expected = lookup(referenceGet, root, *query)
+            assert lookup(root.get, *query) == expected, (root.name, query, expected)
+
+        for name in names:
+            children = [child for child in root.children if child.name == name]
+
+            assert root.getChildren(name) == children
+            assert root.getChild(name) is (children[0] if children else None)
+
+
+def check_lookups(tmp_dir):
+    """
+    Test that the (indexed) element lookups give the same results as a recursive search
+    """
+
+    print("Checking element lookups...")
+
+    fname = os.path.join(tmp_dir, "lookups.xml")
+
+    # Elements without the attribute used by a lookup, and names which are nested within each other
+    netlist_gen.addFields(NETLIST, fname, {
+        "R1": [("Notes", ""), ("Value", "22K"), ("Notes", "duplicate")],
+        "R2": [("Notes", "second")],
+    })
+
+    with open(fname, 'r') as f:
+        text = f.read()
+
+    text = text.replace('<field name="Value">R</field>', '<field name="Value">R</field>\n        <field>unnamed</field>')
+
+    with open(fname, 'w') as f:
+        f.write(text)
+
+    for parser in ["sax", "expat"]:
+        for fname in [NETLIST, os.path.join(tmp_dir, "lookups.xml")]:
+            net, t = load(fname, parser, False)
+
+            roots = [net.tree, net.design] + [c.element for c in net.components] + [p.element for p in net.libparts]
+
+            checkLookups(net.tree, roots)
+
+    # An empty match hides any matches nested within it
+    top = xmlElement("a")
+    empty = top.addChild(xmlElement("a", top))
+    nested = empty.addChild(xmlElement("a", empty))
+    nested.setChars("nested")
+    nested.addAttribute("name", "x")
+    sibling = top.addChild(xmlElement("b", top))
+    sibling.addChild(xmlElement("a", sibling)).setChars("sibling")
+
+    assert top.get("a") == ""
+    assert empty.get("a") == ""
+    assert sibling.get("a") == "sibling"
+
+    checkLookups(top, allElements(top))
+
+    # The indexes are rebuilt when the tree is modified
+    net, t = load(NETLIST, "expat", False)
+    checkLookups(net.tree, [net.tree] + [c.element for c in net.components])
+
+    comp = net.components[0].element
+    fields = comp.addChild(xmlElement("fields", comp))
+    field = fields.addChild(xmlElement("field", fields))
+    field.addAttribute("name", "Added")
+    field.setChars("added")
+
+    assert comp.get("field", "name", "Added") == "added"
+    assert net.tree.get("field", "name", "Added") == "added"
+
+    net.components[1].element.getChild("libsource").setAttribute("part", "Changed")
+
+    checkLookups(net.tree, [net.tree] + [c.element for c in net.components])
+
+
+def replaceInComponent(text, ref, old, new):
+    """Replace text within one component of a netlist"""
+
+    start = text.index('<comp ref="{r}">'.format(r=ref))
+    end = text.index('</comp>', start)
+
+    return text[:start] + text[start:end].replace(old, new) + text[end:]
+
+
+def componentData(net):
+    """
+    Return the components (with their resolved fields) and the library parts which they are linked to
+    """
+
+    libparts = [id(p) for p in net.libparts]
+
+    data = []
+
+    for c in net.components:
+        names = ["Value", "Footprint", "Datasheet", "Description", "Part", "Part Lib", "Voltage"] + c.getFieldNames()
+
+        data.append((
+            treeRecords(c.element),
+            libparts.index(id(c.getLibPart())) if c.getLibPart() else None,
+            [(name, c.getField(name)) for name in names],
+        ))
+
+    return data, [treeRecords(p.element) for p in net.libparts], treeRecords(net.design)
+
+
+def check_skip_nets(tmp_dir):
+    """
+    Test that skipping the <nets> and <libraries> sections gives the same components,
+    fields and library parts as a full parse, including parts which are used by an alias
+    (and when the skipped sections come before the library parts)
+    """
+
+    print("Checking skipped sections...")
+
+    with open(NETLIST, 'r') as f:
+        text = f.read()
+
+    # Use an alias for R2, and add a library field for the capacitors (which is empty for C1)
+    aliased = replaceInComponent(text, "R2", 'part="R"', 'part="R_Small"')
+    aliased = replaceInComponent(aliased, "C1", '      <libsource', '      <fields>\n        <field name="Voltage"/>\n      </fields>\n      <libsource')
+    aliased = aliased.replace(
+        '<description>Resistor</description>\n      <docs>~</docs>\n',
+        '<description>Resistor</description>\n      <docs>~</docs>\n      <aliases>\n        <alias>R_Small</alias>\n      </aliases>\n')
+    aliased = aliased.replace('<field name="Value">C</field>', '<field name="Value">C</field>\n        <field name="Voltage">50V</field>')
+
+    # Move the skipped sections before the library parts
+    libparts = aliased[aliased.index('  <libparts>'):aliased.index('  <libraries>')]
+    reordered = aliased.replace(libparts, '').replace('</export>', libparts + '</export>')
+
+    assert aliased != text and 'R_Small' in aliased
+    assert reordered.index('<nets>') < reordered.index('<libparts>')
+
+    fnames = [NETLIST]
+
+    for name, contents in [("aliased.xml", aliased), ("reordered.xml", reordered)]:
+        fname = os.path.join(tmp_dir, name)
+
+        with open(fname, 'w') as f:
+            f.write(contents)
+
+        fnames.append(fname)
+
+    for fname in fnames:
+        for parser in ["sax", "expat"]:
+            full, t = load(fname, parser, False)
+            skipped, t = load(fname, parser, True)
+
+            assert len(full.nets) > 0 and len(full.libraries) > 0
+            assert len(skipped.nets) == 0 and len(skipped.libraries) == 0
+
+            assert componentData(skipped) == componentData(full), "Skipped sections differ for {f} ({p})".format(f=fname, p=parser)
+
+            for c in skipped.components:
+                assert c.getLibPart() is not None
+
+            if fname != NETLIST:
+                components = dict([(c.getRef(), c) for c in skipped.components])
+
+                assert components["R2"].getPartName() == "R_Small"
+                assert components["R2"].getLibPart() is components["R1"].getLibPart()
+                assert components["C1"].getField("Voltage") == "50V"
+
+
+class Unpickled(object):
+    """Records that it was unpickled"""
+
+    loaded = False
+
+    def __reduce__(self):
+        return (Unpickled.mark, ())
+
+    @staticmethod
+    def mark():
+        Unpickled.loaded = True
+
+
+def check_cache(tmp_dir):
+    """
+    Test that the netlist cache is stored as JSON, and that invalid entries are ignored
+    """
+
+    print("Checking netlist cache...")
+
+    cache_dir = os.path.join(tmp_dir, "cache")
+
+    prefs = BomPref()
+    prefs.cacheDir = cache_dir
+
+    expected = netlistData(netlist(NETLIST, prefs))
+
+    key = netlist_cache.cacheKey(NETLIST)
+    fname = os.path.join(cache_dir, key + netlist_cache.CACHE_EXT)
+
+    with open(fname, 'r') as f:
+        json.load(f)
+
+    assert netlistData(netlist(NETLIST, prefs)) == expected
+
+    invalid = [
+        pickle.dumps(Unpickled()),
+        b"not json",
+        json.dumps(["export", None, "", [["comp", {"ref": 1}, "", []]]]).encode('utf-8'),
+        json.dumps({"name": "export"}).encode('utf-8'),
+    ]
+
+    for data in invalid:
+        with open(fname, 'wb') as f:
+            f.write(data)
+
+        assert netlist_cache.load(cache_dir, key) is None
+
+        # The netlist is parsed instead
+        assert netlistData(netlist(NETLIST, prefs)) == expected
+
+    assert not Unpickled.loaded
+
+    check_incremental_state()
+
+
+def check_incremental_state():
+    """
+    Test that invalid incremental state is ignored (each entry is checked when it is used)
+    """
+
+    print("Checking incremental state...")
+
+    for state in [[], {"components": []}, {"buckets": "def"}]:
+        try:
+            incremental.checkState(state)
+        except ValueError:
+            continue
+
+        raise AssertionError("Invalid state accepted: {s}".format(s=state))
+
+    keys = {"abc": [True, False, ["alias", 1], "10k"], "bad": [{}], "short": [["alias"]], "none": "abc"}
+
+    assert incremental._previousKey(keys, "abc") == (True, False, ("alias", 1), "10k")
+    assert incremental._previousKey(keys, "missing") is None
+
+    for signature in ["bad", "short", "none"]:
+        assert incremental._previousKey(keys, signature) is None
+
+    buckets = {
+        "def": [["R1", ["R1", "R2"], {"Value": "10k", "Notes": None}]],
+        "refs": [["R1", "R1", {}]],
+        "fields": [["R1", ["R1", "R2"], {"Value": 1}]],
+        "missing": [["R1", ["R1"], {}]],
+        "twice": [["R1", ["R1", "R2"], {}], ["R2", ["R2"], {}]],
+        "first": [["R3", ["R1", "R2"], {}]],
+        "bucket": {"R1": []},
+    }
+
+    refs = {"R1": None, "R2": None}
+
+    assert incremental._previousGroups(buckets, "def", refs) == [("R1", ["R1", "R2"], {"Value": "10k", "Notes": None})]
+
+    for signature in ["refs", "fields", "missing", "twice", "first", "bucket", "unknown"]:
+        assert incremental._previousGroups(buckets, signature, refs) is None, signature
+
+    # Invalid entries are grouped again (giving the same groups as a full run)
+    prefs = BomPref()
+    net = netlist(NETLIST, prefs)
+    components = net.getInterestingComponents()
+
+    groups, state = incremental.groupComponents(components, prefs, {})
+    expected = [([c.getRef() for c in g.components], g.fields) for g in groups]
+
+    state = json.loads(json.dumps(state))
+
+    assert len(state["components"]) > 0 and len(state["buckets"]) > 0
+
+    invalid = {
+        "components": dict([(signature, [{}]) for signature in state["components"]]),
+        "buckets": dict([(signature, [["X1", ["X1"], {}]]) for signature in state["buckets"]]),
+    }
+
+    for previous in [state, invalid, incremental.checkState(invalid)]:
+        groups, _ = incremental.groupComponents(components, prefs, previous)
+        assert [([c.getRef() for c in g.components], g.fields) for g in groups] == expected
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="KiBoM netlist parser test")
+    parser.add_argument("--size", type=int, default=2000, help="Number of components in the largest synthetic netlist")
+
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        check_netlists(tmp_dir, args.size)
+        check_lookups(tmp_dir)
+        check_skip_nets(tmp_dir)
+        check_cache(tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("All tests passed... OK...")
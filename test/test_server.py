@@ -0,0 +1,166 @@
+"""
+Test the BoM server (--server) and client.
+
+Run from the top level directory, after run-tests.sh has generated test/bom-out_bom_A.csv
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.__main__ import runJob  # noqa: E402
+from kibom.server import BomServer  # noqa: E402
+from kibom import client  # noqa: E402
+
+TEST_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# For running KiBoM in a subprocess
+ENV = dict(os.environ, PYTHONPATH=os.path.dirname(TEST_DIR))
+
+with open(os.path.join(TEST_DIR, 'bom-out_bom_A.csv'), 'r') as f:
+    EXPECTED = f.read()
+
+
+def check_bom(name):
+    with open(os.path.join(TEST_DIR, name), 'r') as f:
+        assert f.read() == EXPECTED
+
+
+def check_jobs():
+    """
+    Test jobs run by the server (in this process)
+    """
+
+    print("Checking server jobs...")
+
+    server = BomServer(runJob)
+
+    # Relative to the working directory of the job
+    for i in range(2):
+        response = server.handle({"args": ["kibom-test.xml", "bom-server.csv"], "cwd": TEST_DIR})
+
+        assert response["status"] == 0
+        check_bom('bom-server_bom_A.csv')
+
+    # Preferences are read once
+    assert len(server.preferences) == 1
+
+    response = server.handle({"args": ["missing.xml", "bom-server.csv"], "cwd": TEST_DIR})
+
+    assert response["status"] != 0
+    assert "does not exist" in response["output"]
+
+    # Invalid arguments
+    response = server.handle({"args": ["--number", "abc"]})
+
+    assert response["status"] != 0
+    assert "invalid int value" in response["output"]
+
+    assert server.handle({"command": "ping"})["status"] == 0
+    assert server.handle({"command": "unknown"})["status"] != 0
+
+
+def check_stdin():
+    """
+    Test the JSON lines protocol (--server -)
+    """
+
+    print("Checking server (stdin)...")
+
+    jobs = [
+        {"args": ["kibom-test.xml", "bom-stdin.csv"], "cwd": TEST_DIR},
+        {"command": "ping"},
+    ]
+
+    result = subprocess.run(
+        [sys.executable, "-m", "kibom", "--server", "-"],
+        input="\n".join([json.dumps(j) for j in jobs]) + "\n",
+        stdout=subprocess.PIPE,
+        env=ENV,
+        universal_newlines=True,
+        check=True)
+
+    responses = [json.loads(line) for line in result.stdout.splitlines()]
+
+    assert len(responses) == 2
+    assert responses[0]["status"] == 0
+
+    check_bom('bom-stdin_bom_A.csv')
+
+
+def check_socket():
+    """
+    Test the client, with the server listening on a Unix socket
+    """
+
+    print("Checking server (socket)...")
+
+    path = os.path.join(tempfile.mkdtemp(), "kibom.sock")
+
+    server = subprocess.Popen([sys.executable, "-m", "kibom", "--server", path], stdout=subprocess.DEVNULL, env=ENV)
+
+    try:
+        for i in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.1)
+
+        assert client.request({"command": "ping"}, path)["status"] == 0
+
+        env = dict(ENV, KIBOM_SOCKET=path)
+
+        result = subprocess.run([sys.executable, "-m", "kibom.client", "kibom-test.xml", "bom-socket.csv"], cwd=TEST_DIR, env=env)
+
+        assert result.returncode == 0
+        check_bom('bom-socket_bom_A.csv')
+
+        client.request({"command": "shutdown"}, path)
+
+        assert server.wait(timeout=10) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+
+    assert not os.path.exists(path)
+
+
+def check_socket_path():
+    """
+    Test that the server does not remove a file which is not a socket
+    """
+
+    print("Checking server socket path...")
+
+    path = os.path.join(tempfile.mkdtemp(), "kibom.sock")
+
+    with open(path, 'w') as f:
+        f.write("not a socket")
+
+    result = subprocess.run([sys.executable, "-m", "kibom", "--server", path], stdout=subprocess.DEVNULL, env=ENV, timeout=30)
+
+    assert result.returncode != 0
+
+    with open(path, 'r') as f:
+        assert f.read() == "not a socket"
+
+
+if __name__ == '__main__':
+
+    print("Running server tests")
+
+    check_jobs()
+    check_stdin()
+
+    if hasattr(socket, "AF_UNIX"):
+        check_socket()
+        check_socket_path()
+
+    print("All tests passed... OK...")
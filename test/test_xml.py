@@ -0,0 +1,175 @@
+"""
+Test the XML writer against the ElementTree document it used to build.
+
+The test netlist (with some variant fields added) is written to XML with and
+without variants, and the file is parsed with ElementTree.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kibom.netlist_reader import netlist  # noqa: E402
+from kibom.preferences import BomPref  # noqa: E402
+from kibom.columns import ColumnList  # noqa: E402
+from kibom.bom_writer import WriteBoM  # noqa: E402
+from kibom.xml_writer import xmlName  # noqa: E402
+
+import netlist_gen  # noqa: E402
+
+NETLIST = os.path.join(os.path.dirname(__file__), "kibom-test.xml")
+
+# Characters which must be escaped in an attribute value
+NOTES = 'first line\r\n  "second" & <third>\tline'
+
+# Variant fields (and a field for NOTES, which is set after the netlist is read)
+FIELDS = {
+    "R1": [("V1:Value", "22K"), ("Notes", "-")],
+    "R2": [("V1", "DNF")],
+    "R3": [("V1:Value", "2K2"), ("V2:Value", "1K")],
+    "C1": [("V2", "DNF")],
+}
+
+
+def referenceXML(groups, net, headings, prefs):
+    """
+    Return the document as the ElementTree writer built it.
+    (Column names containing ':' could not be written, so they are renamed here in the same way)
+    """
+
+    attrib = {}
+
+    attrib['Schematic_Source'] = net.getSource()
+    attrib['Schematic_Version'] = net.getVersion()
+    attrib['Schematic_Date'] = net.getSheetDate()
+    attrib['PCB_Variant'] = ', '.join(prefs.pcbConfig)
+    attrib['BOM_Date'] = net.getDate()
+    attrib['KiCad_Version'] = net.getTool()
+    attrib['Component_Groups'] = str(len(groups))
+    attrib['Component_Count'] = str(sum([g.getCount() for g in groups]))
+    attrib['Fitted_Components'] = str(sum([g.getFittedCount() for g in groups]))
+    attrib['Number_of_PCBs'] = str(prefs.boards)
+    attrib['Total_Components'] = str(sum([g.getBuildCount() for g in groups]))
+
+    xml = ElementTree.Element('KiCad_BOM', attrib=attrib, encoding='utf-8')
+
+    headings = [h for h in headings if not h.lower() in prefs.ignore]
+
+    for group in groups:
+        if prefs.ignoreDNF and not group.isFitted():
+            continue
+
+        row = group.getRow(headings)
+
+        attrib = {}
+
+        for i, h in enumerate(headings):
+            attrib[xmlName(h)] = str(row[i])
+
+        ElementTree.SubElement(xml, "group", attrib=attrib)
+
+    return ElementTree.fromstring(ElementTree.tostring(xml, encoding="utf-8"))
+
+
+def writeXML(fname, out, complexVariant, variant):
+    """
+    Write the BoM for a variant, returning (parsed file, reference document)
+    """
+
+    prefs = BomPref()
+    prefs.complexVariant = complexVariant
+    prefs.backup = False
+
+    if variant is not None:
+        prefs.pcbConfig = variant.lower().split(',')
+
+    net = netlist(fname, prefs)
+
+    if complexVariant:
+        components = net.getVariantComponents(prefs.pcbConfig)
+    else:
+        components = net.getInterestingComponents()
+
+    for c in components:
+        if c.getRef() == "R1":
+            c.setField("Notes", NOTES)
+
+    groups = net.groupComponents(components)
+
+    columns = ColumnList(prefs.corder)
+
+    for g in groups:
+        for f in g.fields:
+            columns.AddColumn(f)
+
+    assert WriteBoM(out, groups, net, columns.columns, prefs)
+
+    return ElementTree.parse(out).getroot(), referenceXML(groups, net, columns.columns, prefs)
+
+
+def groupWith(root, ref):
+    """Return the attributes of the group which contains a reference"""
+    for group in root:
+        if ref in group.attrib["References"].split():
+            return group.attrib
+    return None
+
+
+def check_xml(tmp_dir):
+
+    fname = os.path.join(tmp_dir, "variants.xml")
+    netlist_gen.addFields(NETLIST, fname, FIELDS)
+
+    for complexVariant, variant in [(False, None), (True, None), (True, "V1"), (True, "V2"), (True, "V1,V2")]:
+        print("Checking XML output (complex variant {c}, variant {v})...".format(c=complexVariant, v=variant))
+
+        root, expected = writeXML(fname, os.path.join(tmp_dir, "bom.xml"), complexVariant, variant)
+
+        assert root.tag == "KiCad_BOM"
+        assert root.attrib == expected.attrib, (root.attrib, expected.attrib)
+        assert root.attrib["PCB_Variant"] == variant.lower().replace(",", ", ") if variant else "default"
+        assert root.attrib["encoding"] == "utf-8"
+
+        assert len(root) > 0
+        assert [g.tag for g in root] == ["group" for g in expected]
+        assert [g.attrib for g in root] == [g.attrib for g in expected]
+
+        r1 = groupWith(root, "R1")
+
+        # ':' is not valid in an attribute name (without a namespace)
+        assert r1["V1_Value"].split()[0] == "22K"
+        assert r1["Notes"] == NOTES
+
+        if variant == "V1":
+            assert r1["Value"] == "22K"
+            assert groupWith(root, "R2") is None
+            assert groupWith(root, "R3")["Value"] == "2K2"
+        elif variant == "V2":
+            assert groupWith(root, "R3")["Value"] == "1K"
+            assert groupWith(root, "C1") is None
+        elif variant == "V1,V2":
+            assert groupWith(root, "R2") is None
+            assert groupWith(root, "C1") is None
+        else:
+            assert r1["Value"] != "22K"
+            assert groupWith(root, "R2") is not None
+
+
+if __name__ == '__main__':
+
+    print("Running XML writer tests")
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        check_xml(tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("All tests passed... OK...")